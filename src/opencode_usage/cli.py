@@ -3,29 +3,33 @@
 from __future__ import annotations
 
 import argparse
-import json
 import re
 import sys
 from datetime import datetime, timedelta
 from typing import Any
 
-from . import __version__, render
-from .db import OpenCodeDB, UsageRow
-from .render import render_daily, render_grouped, render_summary
+from . import __version__
+
+# Rich and the DB layer are imported inside the subcommands so ``--help``,
+# ``--version`` and ``--json`` don't pay for loading Rich.
+
+_SINCE_RE = re.compile(r"(\d+)([dhwm])")
+
+# Relative --since units → (timedelta keyword, multiplier); a month is 30 days.
+_SINCE_UNITS: dict[str, tuple[str, int]] = {
+    "h": ("hours", 1),
+    "d": ("days", 1),
+    "w": ("weeks", 1),
+    "m": ("days", 30),
+}
 
 
 def _parse_since(value: str) -> datetime:
     """Parse a relative duration like '7d', '2w', '30d', '3h' or an ISO date."""
-    m = re.fullmatch(r"(\d+)([dhwm])", value.strip().lower())
+    m = _SINCE_RE.fullmatch(value.strip().lower())
     if m:
-        n, unit = int(m.group(1)), m.group(2)
-        delta = {
-            "h": timedelta(hours=n),
-            "d": timedelta(days=n),
-            "w": timedelta(weeks=n),
-            "m": timedelta(days=n * 30),
-        }[unit]
-        return datetime.now().astimezone() - delta
+        kw, mult = _SINCE_UNITS[m.group(2)]
+        return datetime.now().astimezone() - timedelta(**{kw: int(m.group(1)) * mult})
 
     try:
         dt = datetime.fromisoformat(value)
@@ -126,9 +130,13 @@ def _build_parser() -> argparse.ArgumentParser:
     return p
 
 
-def _resolve_since(args: argparse.Namespace) -> tuple[datetime | None, str]:
+def _resolve_since(
+    args: argparse.Namespace,
+    now: datetime | None = None,
+) -> tuple[datetime | None, str]:
     """Resolve the effective 'since' datetime and a human-readable period label."""
-    now = datetime.now().astimezone()
+    if now is None:
+        now = datetime.now().astimezone()
 
     if args.since is not None:
         return args.since, f"Since {args.since.strftime('%Y-%m-%d')}"
@@ -141,103 +149,88 @@ def _resolve_since(args: argparse.Namespace) -> tuple[datetime | None, str]:
     return since, "Last 7 days"
 
 
-def _fetch_rows(
-    db: OpenCodeDB,
-    group_by: str,
-    *,
-    since: datetime | None = None,
-    until: datetime | None = None,
-    limit: int | None = None,
-) -> list[UsageRow]:
-    """Fetch rows based on group_by dimension."""
-    if group_by == "day":
-        return db.daily(since=since, until=until, limit=limit)
-    if group_by == "model":
-        return db.by_model(since=since, until=until, limit=limit)
-    if group_by == "agent":
-        return db.by_agent(since=since, until=until, limit=limit)
-    if group_by == "provider":
-        return db.by_provider(since=since, until=until, limit=limit)
-    if group_by == "session":
-        return db.by_session(since=since, until=until, limit=limit)
-    return []
-
-
-def _compute_deltas(
-    current: list[UsageRow],
-    previous: list[UsageRow],
-) -> list[float | None]:
-    """Compute token delta percentages between current and previous rows."""
-    prev_map: dict[str, int] = {}
-    for r in previous:
-        key = f"{r.label}:{r.detail}" if r.detail else r.label
-        prev_map[key] = prev_map.get(key, 0) + r.tokens.total
-
-    deltas: list[float | None] = []
-    for r in current:
-        key = f"{r.label}:{r.detail}" if r.detail else r.label
-        prev_val = prev_map.get(key)
-        if prev_val and prev_val > 0:
-            deltas.append((r.tokens.total - prev_val) / prev_val * 100)
-        else:
-            deltas.append(None)
-    return deltas
+def _write_json(output: dict[str, Any]) -> None:
+    """Write *output* to stdout as indented JSON, using orjson when installed."""
+    try:
+        import orjson
+    except ImportError:
+        import json
+
+        json.dump(output, sys.stdout, indent=2, ensure_ascii=False)
+        sys.stdout.write("\n")
+        return
+
+    data = orjson.dumps(output, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE)
+    # Text-only streams (e.g. a redirected io.StringIO) have no byte buffer.
+    buffer = getattr(sys.stdout, "buffer", None)
+    if buffer is None:
+        sys.stdout.write(data.decode())
+        return
+    sys.stdout.flush()
+    buffer.write(data)
+    buffer.flush()
 
 
 def _cmd_run(args: argparse.Namespace) -> None:
     """Execute the ``run`` subcommand."""
+    from .db import OpenCodeDB, to_ms
+
     try:
         db = OpenCodeDB()
     except FileNotFoundError as e:
+        from . import render
+
         render.console.print(f"[red]Error:[/red] {e}")
         sys.exit(1)
 
-    since, period = _resolve_since(args)
+    # One clock reading per run: the window and the --compare period share it.
+    now = datetime.now().astimezone()
+    since, period = _resolve_since(args, now)
     group_by = args.by or "day"
 
-    now = datetime.now().astimezone()
-    prev_since = None
+    # Bounds are converted to epoch ms once; every query below binds them as-is.
+    since_ms = to_ms(since) if since is not None else None
+    prev_since_ms = None
     if args.compare and since is not None:
         period_length = now - since
-        prev_since = since - period_length
-
-    rows = _fetch_rows(db, group_by, since=since, limit=args.limit)
-    total = db.totals(since=since)
-
-    prev_total = None
-    prev_rows: list[UsageRow] = []
-    if prev_since is not None:
-        prev_total = db.totals(since=prev_since, until=since)
-        if group_by != "day":
-            prev_rows = _fetch_rows(db, group_by, since=prev_since, until=since, limit=args.limit)
+        prev_since_ms = to_ms(since - period_length)
 
     if args.json_output:
-        output: dict[str, Any] = {
-            "period": period,
-            "total": db.to_dicts([total])[0],
-            "rows": db.to_dicts(rows),
-        }
-        if prev_total is not None:
-            output["previous_total"] = db.to_dicts([prev_total])[0]
-        if prev_rows:
-            output["previous_rows"] = db.to_dicts(prev_rows)
-        print(json.dumps(output, indent=2, ensure_ascii=False))
+        output: dict[str, Any] = {"period": period}
+        if since_ms is not None and prev_since_ms is not None:
+            json_rows, output["total"], json_prev_rows, json_prev_total = db.compare_dicts(
+                group_by, since=since_ms, prev_since=prev_since_ms, limit=args.limit
+            )
+            output["rows"] = json_rows
+            output["previous_total"] = json_prev_total
+            if json_prev_rows and group_by != "day":
+                output["previous_rows"] = json_prev_rows
+        else:
+            json_rows, output["total"] = db.fetch_dicts(group_by, since=since_ms, limit=args.limit)
+            output["rows"] = json_rows
+        _write_json(output)
         return
 
-    render_summary(total, period, prev_total=prev_total)
-    render.console.print()
+    prev_total = None
+    deltas: list[float | None] | None = None
+    if since_ms is not None and prev_since_ms is not None:
+        rows, deltas, total, prev_total = db.fetch_with_deltas(
+            group_by, since=since_ms, prev_since=prev_since_ms, limit=args.limit
+        )
+        if prev_total.calls == 0:
+            deltas = None
+    else:
+        rows, total = db.fetch(group_by, since=since_ms, limit=args.limit)
 
-    deltas = _compute_deltas(rows, prev_rows) if prev_rows else None
+    from .render import render_report
 
-    if group_by == "day":
-        render_daily(rows, period)
-    else:
-        render_grouped(rows, group_by, period, deltas=deltas)
+    render_report(total, rows, group_by, period, prev_total=prev_total, deltas=deltas)
 
 
 def _cmd_insights(args: argparse.Namespace) -> None:
     """Execute the ``insights`` subcommand."""
     if args.model is None:
+        from . import render
         from .models import select_model_interactive
 
         args.model = select_model_interactive(render.console)
@@ -3,21 +3,153 @@
 from __future__ import annotations
 
 import json
+import os
 import sqlite3
+import weakref
 from dataclasses import dataclass, field
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 from typing import Any
 
 from ._opencode_cli import get_db_path
 
+# Usage aggregations read every field from a single projection of ``message``
+# so each JSON document is walked once per row rather than once per column.
+# Filters stay on the raw ``json_extract`` expressions so they can match the
+# expression index created by ``OpenCodeDB._ensure_indexes``. The ``->>``
+# operator is deliberately not used: it is no faster than ``json_extract`` on
+# the SQLite versions we ship against, and the index must match the filter.
+_USAGE_CTE = """
+    {name} AS (
+        SELECT
+            session_id,
+            json_extract(data, '$.time.created')       AS created,
+            json_extract(data, '$.modelID')            AS model,
+            json_extract(data, '$.agent')              AS agent,
+            json_extract(data, '$.providerID')         AS provider,
+            json_extract(data, '$.tokens.input')       AS input,
+            json_extract(data, '$.tokens.output')      AS output,
+            json_extract(data, '$.tokens.reasoning')   AS reasoning,
+            json_extract(data, '$.tokens.cache.read')  AS cache_read,
+            json_extract(data, '$.tokens.cache.write') AS cache_write,
+            json_extract(data, '$.tokens.total')       AS total,
+            json_extract(data, '$.cost')               AS cost
+        FROM message
+        WHERE json_extract(data, '$.role') = 'assistant'
+          AND json_extract(data, '$.tokens.total') IS NOT NULL
+          {time_clause}
+    )
+"""
+
+_CREATED_INDEX_NAME = "idx_message_assistant_created"
+_CREATED_INDEX_SQL = f"""
+    CREATE INDEX IF NOT EXISTS {_CREATED_INDEX_NAME}
+    ON message (json_extract(data, '$.time.created'))
+    WHERE json_extract(data, '$.role') = 'assistant'
+"""
+
+# Applied once to the shared connection: a larger page cache and mmap let
+# repeated scans of ``message`` in one invocation be served from memory.
+_CONNECTION_PRAGMAS = (
+    "PRAGMA cache_size = -20000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+)
+
+# Older messages omit some token fields (reasoning, cache), so a group can
+# sum to NULL; COALESCE is evaluated once per group, not per row. Cost falls
+# back to 0.0 so an empty window still serializes as a float.
+_USAGE_AGGREGATES = """
+                COUNT(*)                          AS calls,
+                COALESCE(SUM(input),       0)     AS input_tokens,
+                COALESCE(SUM(output),      0)     AS output_tokens,
+                COALESCE(SUM(reasoning),   0)     AS reasoning_tokens,
+                COALESCE(SUM(cache_read),  0)     AS cache_read,
+                COALESCE(SUM(cache_write), 0)     AS cache_write,
+                COALESCE(SUM(total),       0)     AS total_tokens,
+                COALESCE(SUM(cost),        0.0)   AS cost
+"""
+
+# Same columns as ``_USAGE_AGGREGATES``, re-aggregated over already grouped rows.
+_TOTAL_AGGREGATES = """
+                COALESCE(SUM(calls),            0) AS calls,
+                COALESCE(SUM(input_tokens),     0) AS input_tokens,
+                COALESCE(SUM(output_tokens),    0) AS output_tokens,
+                COALESCE(SUM(reasoning_tokens), 0) AS reasoning_tokens,
+                COALESCE(SUM(cache_read),       0) AS cache_read,
+                COALESCE(SUM(cache_write),      0) AS cache_write,
+                COALESCE(SUM(total_tokens),     0) AS total_tokens,
+                COALESCE(SUM(cost),           0.0) AS cost
+"""
+
+
+@dataclass(frozen=True)
+class _Grouping:
+    """How a usage view labels, groups and orders rows of the usage CTE."""
 
+    label: str
+    detail: str = "NULL"
+    group: str = "label"
+    order: str = "total_tokens DESC"
+    join: str = ""
+    unknown: str = "(unknown)"
+
+    def select(self, source: str = "m") -> str:
+        """Grouped aggregate over the usage CTE named *source*."""
+        return f"""
+            SELECT
+                {self.label} AS label,
+                {self.detail} AS detail,
+                {_USAGE_AGGREGATES}
+            FROM {source} AS m {self.join}
+            GROUP BY {self.group}
+        """
+
+
+_GROUPINGS: dict[str, _Grouping] = {
+    # Ordering by the label lets SQLite walk the GROUP BY sorter backwards;
+    # ordering by MAX(created) would add a second temp B-tree sort.
+    "day": _Grouping(
+        label="date(created / 1000, 'unixepoch', 'localtime')",
+        order="label DESC",
+    ),
+    "model": _Grouping(label="model"),
+    # Agent x model, showing which model each agent uses.
+    "agent": _Grouping(
+        label="agent",
+        detail="model",
+        group="agent, model",
+        order="label, total_tokens DESC",
+    ),
+    "provider": _Grouping(label="provider"),
+    # Session title as label, grouped by id so equal titles stay separate.
+    "session": _Grouping(
+        label="COALESCE(s.title, m.session_id)",
+        group="m.session_id",
+        join="LEFT JOIN session s ON m.session_id = s.id",
+        unknown="(untitled)",
+    ),
+}
+
+_TOTAL_GROUPING = _Grouping(label="'total'")
+
+
+def _grouping(group_by: str) -> _Grouping:
+    """Look up the grouping spec for a ``--by`` dimension."""
+    grouping = _GROUPINGS.get(group_by)
+    if grouping is None:
+        raise ValueError(f"Unknown group_by: {group_by!r}")
+    return grouping
+
+
+@lru_cache(maxsize=1)
 def _default_db_path() -> Path:
-    """Resolve the OpenCode database path per platform."""
+    """Resolve the OpenCode database path per platform, once per process."""
     return get_db_path()
 
 
-@dataclass
+@dataclass(slots=True)
 class TokenStats:
     input: int = 0
     output: int = 0
@@ -27,7 +159,7 @@ class TokenStats:
     total: int = 0
 
 
-@dataclass
+@dataclass(slots=True)
 class UsageRow:
     """A single aggregated usage row."""
 
@@ -38,6 +170,59 @@ class UsageRow:
     detail: str | None = None
 
 
+def to_ms(value: datetime | int) -> int:
+    """Epoch milliseconds for a time bound; ints pass through unchanged."""
+    if isinstance(value, int):
+        return value
+    return int(value.timestamp() * 1000)
+
+
+def _sql_limit(limit: int | None) -> int:
+    """Bind value for ``LIMIT ?``; SQLite treats a negative limit as unlimited.
+
+    Always binding the limit keeps each query's SQL text fixed so the
+    connection's statement cache can reuse the prepared statement.
+    """
+    return limit if limit else -1
+
+
+def _usage_row(r: sqlite3.Row, label: str, detail: str | None = None) -> UsageRow:
+    """Build a :class:`UsageRow` from a row selected with ``_USAGE_AGGREGATES``."""
+    return UsageRow(
+        label=label,
+        calls=r["calls"],
+        tokens=TokenStats(
+            input=r["input_tokens"],
+            output=r["output_tokens"],
+            reasoning=r["reasoning_tokens"],
+            cache_read=r["cache_read"],
+            cache_write=r["cache_write"],
+            total=r["total_tokens"],
+        ),
+        cost=r["cost"],
+        detail=detail,
+    )
+
+
+# Usage rows start with label, detail and calls; the token sums follow in
+# ``_USAGE_AGGREGATES`` order and map positionally onto these JSON keys.
+_TOKEN_KEYS = ("input", "output", "reasoning", "cache_read", "cache_write", "total")
+_TOKEN_COLUMNS = slice(3, 3 + len(_TOKEN_KEYS))
+
+
+def _usage_dict(r: sqlite3.Row, label: str, detail: str | None = None) -> dict[str, Any]:
+    """Serialize a ``_USAGE_AGGREGATES`` row in the :meth:`OpenCodeDB.to_dicts` shape."""
+    d: dict[str, Any] = {
+        "label": label,
+        "calls": r["calls"],
+        "tokens": dict(zip(_TOKEN_KEYS, r[_TOKEN_COLUMNS], strict=True)),
+        "cost": round(r["cost"], 4),
+    }
+    if detail is not None:
+        d["model"] = detail
+    return d
+
+
 @dataclass
 class SessionMeta:
     """Metadata about a user session."""
@@ -58,7 +243,13 @@ class SessionMeta:
 
 
 class OpenCodeDB:
-    """Read-only access to the OpenCode SQLite database."""
+    """Query access to the OpenCode SQLite database.
+
+    Queries run on a read-only connection. Only when
+    ``OPENCODE_USAGE_CREATE_INDEX=1`` is set does construction add the
+    ``idx_message_assistant_created`` index to a writable file that lacks it
+    (skipped if OpenCode is holding a write lock).
+    """
 
     def __init__(self, db_path: Path | str | None = None) -> None:
         self.path = Path(db_path) if db_path else _default_db_path()
@@ -66,258 +257,333 @@ class OpenCodeDB:
             raise FileNotFoundError(
                 f"OpenCode database not found at {self.path}\nSet OPENCODE_DB env var to override."
             )
+        self._conn: sqlite3.Connection | None = None
+        if os.environ.get("OPENCODE_USAGE_CREATE_INDEX") == "1":
+            self._ensure_indexes()
+
+    def _ensure_indexes(self) -> None:
+        """Best-effort creation of the partial index on assistant message time.
+
+        Every usage query filters on role and ``time.created``; without an
+        expression index SQLite has to scan and parse every message. This
+        changes OpenCode's schema, so it is opt-in. An existing index is
+        detected over the read-only connection, and a read-write connection is
+        opened only when the index is missing and the file is writable —
+        otherwise queries simply fall back to a full scan. ``timeout=0`` makes a
+        locked database (OpenCode mid-write) skip the index instead of stalling
+        startup.
+        """
+        exists = self._connect().execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+            [_CREATED_INDEX_NAME],
+        )
+        if exists.fetchone() is not None or not os.access(self.path, os.W_OK):
+            return
+        try:
+            conn = sqlite3.connect(f"file:{self.path}?mode=rw", uri=True, timeout=0)
+        except sqlite3.Error:
+            return
+        try:
+            with conn:
+                conn.execute(_CREATED_INDEX_SQL)
+        except sqlite3.Error:
+            pass
+        finally:
+            conn.close()
 
     def _connect(self) -> sqlite3.Connection:
-        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Return the shared read-only connection, opening it on first use."""
+        if self._conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            conn.row_factory = sqlite3.Row
+            for pragma in _CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            self._conn = conn
+            self._finalizer = weakref.finalize(self, conn.close)
+        return self._conn
+
+    def close(self) -> None:
+        """Close the shared connection; the next query reopens it."""
+        if self._conn is not None:
+            self._finalizer()
+            self._conn = None
+
+    def __enter__(self) -> OpenCodeDB:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
 
     # ── query helpers ─────────────────────────────────────────────
 
     def _time_filter(
         self,
-        since: datetime | None,
-        until: datetime | None = None,
+        since: datetime | int | None,
+        until: datetime | int | None = None,
         *,
         col: str = "data",
     ) -> tuple[str, list[Any]]:
-        """Return WHERE clause fragments and params for time filtering."""
+        """Return WHERE clause fragments and params for time filtering.
+
+        Bounds may be datetimes or epoch milliseconds already converted by
+        :func:`to_ms`.
+        """
+        if since is None and until is None:
+            return "", []
         clauses: list[str] = []
         params: list[Any] = []
         if since is not None:
-            ts_ms = int(since.timestamp() * 1000)
             clauses.append(f"AND json_extract({col}, '$.time.created') >= ?")
-            params.append(ts_ms)
+            params.append(to_ms(since))
         if until is not None:
-            ts_ms = int(until.timestamp() * 1000)
             clauses.append(f"AND json_extract({col}, '$.time.created') < ?")
-            params.append(ts_ms)
+            params.append(to_ms(until))
         return " ".join(clauses), params
 
     def _base_query(
         self,
-        group_expr: str,
-        since: datetime | None = None,
-        until: datetime | None = None,
-        order: str = "total_tokens DESC",
+        grouping: _Grouping,
+        since: datetime | int | None = None,
+        until: datetime | int | None = None,
         limit: int | None = None,
     ) -> list[UsageRow]:
         time_clause, params = self._time_filter(since, until)
 
         sql = f"""
-            SELECT
-                {group_expr} AS label,
-                COUNT(*)                                           AS calls,
-                COALESCE(SUM(json_extract(data, '$.tokens.input')),     0) AS input_tokens,
-                COALESCE(SUM(json_extract(data, '$.tokens.output')),    0) AS output_tokens,
-                COALESCE(SUM(json_extract(data, '$.tokens.reasoning')), 0) AS reasoning_tokens,
-                COALESCE(SUM(json_extract(data, '$.tokens.cache.read')),  0) AS cache_read,
-                COALESCE(SUM(json_extract(data, '$.tokens.cache.write')), 0) AS cache_write,
-                COALESCE(SUM(json_extract(data, '$.tokens.total')),    0) AS total_tokens,
-                COALESCE(SUM(json_extract(data, '$.cost')),            0) AS cost
-            FROM message
-            WHERE json_extract(data, '$.role') = 'assistant'
-              AND json_extract(data, '$.tokens.total') IS NOT NULL
-              {time_clause}
-            GROUP BY label
-            ORDER BY {order}
+            WITH {_USAGE_CTE.format(name="m", time_clause=time_clause)}
+            {grouping.select()}
+            ORDER BY {grouping.order}
+            LIMIT ?
         """
-        if limit:
-            sql += " LIMIT ?"
-            params.append(limit)
-
-        conn = self._connect()
-        try:
-            rows = conn.execute(sql, params).fetchall()
-        finally:
-            conn.close()
+        params.append(_sql_limit(limit))
 
         return [
-            UsageRow(
-                label=r["label"] or "(unknown)",
-                calls=r["calls"],
-                tokens=TokenStats(
-                    input=r["input_tokens"],
-                    output=r["output_tokens"],
-                    reasoning=r["reasoning_tokens"],
-                    cache_read=r["cache_read"],
-                    cache_write=r["cache_write"],
-                    total=r["total_tokens"],
-                ),
-                cost=r["cost"],
-            )
-            for r in rows
+            _usage_row(r, r["label"] or grouping.unknown, r["detail"])
+            for r in self._connect().execute(sql, params)
         ]
 
     # ── public API ────────────────────────────────────────────────
 
     def daily(
         self,
-        since: datetime | None = None,
-        until: datetime | None = None,
+        since: datetime | int | None = None,
+        until: datetime | int | None = None,
         limit: int | None = None,
     ) -> list[UsageRow]:
-        return self._base_query(
-            group_expr=(
-                "date(json_extract(data, '$.time.created') / 1000, 'unixepoch', 'localtime')"
-            ),
-            since=since,
-            until=until,
-            order="label DESC",
-            limit=limit,
-        )
+        return self._base_query(_GROUPINGS["day"], since=since, until=until, limit=limit)
 
     def by_model(
         self,
-        since: datetime | None = None,
-        until: datetime | None = None,
+        since: datetime | int | None = None,
+        until: datetime | int | None = None,
         limit: int | None = None,
     ) -> list[UsageRow]:
-        return self._base_query(
-            group_expr="json_extract(data, '$.modelID')",
-            since=since,
-            until=until,
-            limit=limit,
-        )
+        return self._base_query(_GROUPINGS["model"], since=since, until=until, limit=limit)
 
     def by_agent(
         self,
-        since: datetime | None = None,
-        until: datetime | None = None,
+        since: datetime | int | None = None,
+        until: datetime | int | None = None,
         limit: int | None = None,
     ) -> list[UsageRow]:
         """Group by agent x model, showing which model each agent uses."""
-        time_clause, params = self._time_filter(since, until)
-
-        sql = f"""
-            SELECT
-                json_extract(data, '$.agent')   AS agent,
-                json_extract(data, '$.modelID') AS model,
-                COUNT(*)                                           AS calls,
-                COALESCE(SUM(json_extract(data, '$.tokens.input')),     0) AS input_tokens,
-                COALESCE(SUM(json_extract(data, '$.tokens.output')),    0) AS output_tokens,
-                COALESCE(SUM(json_extract(data, '$.tokens.reasoning')), 0) AS reasoning_tokens,
-                COALESCE(SUM(json_extract(data, '$.tokens.cache.read')),  0) AS cache_read,
-                COALESCE(SUM(json_extract(data, '$.tokens.cache.write')), 0) AS cache_write,
-                COALESCE(SUM(json_extract(data, '$.tokens.total')),    0) AS total_tokens,
-                COALESCE(SUM(json_extract(data, '$.cost')),            0) AS cost
-            FROM message
-            WHERE json_extract(data, '$.role') = 'assistant'
-              AND json_extract(data, '$.tokens.total') IS NOT NULL
-              {time_clause}
-            GROUP BY agent, model
-            ORDER BY agent, total_tokens DESC
-        """
-        if limit:
-            sql += " LIMIT ?"
-            params.append(limit)
-
-        conn = self._connect()
-        try:
-            rows = conn.execute(sql, params).fetchall()
-        finally:
-            conn.close()
-
-        return [
-            UsageRow(
-                label=r["agent"] or "(unknown)",
-                calls=r["calls"],
-                tokens=TokenStats(
-                    input=r["input_tokens"],
-                    output=r["output_tokens"],
-                    reasoning=r["reasoning_tokens"],
-                    cache_read=r["cache_read"],
-                    cache_write=r["cache_write"],
-                    total=r["total_tokens"],
-                ),
-                cost=r["cost"],
-                detail=r["model"],
-            )
-            for r in rows
-        ]
+        return self._base_query(_GROUPINGS["agent"], since=since, until=until, limit=limit)
 
     def by_provider(
         self,
-        since: datetime | None = None,
-        until: datetime | None = None,
+        since: datetime | int | None = None,
+        until: datetime | int | None = None,
         limit: int | None = None,
     ) -> list[UsageRow]:
-        return self._base_query(
-            group_expr="json_extract(data, '$.providerID')",
-            since=since,
-            until=until,
-            limit=limit,
-        )
+        return self._base_query(_GROUPINGS["provider"], since=since, until=until, limit=limit)
 
     def by_session(
         self,
-        since: datetime | None = None,
-        until: datetime | None = None,
+        since: datetime | int | None = None,
+        until: datetime | int | None = None,
         limit: int | None = None,
     ) -> list[UsageRow]:
         """Group by session, using session title as label."""
-        time_clause, params = self._time_filter(since, until, col="m.data")
+        return self._base_query(_GROUPINGS["session"], since=since, until=until, limit=limit)
+
+    def totals(
+        self,
+        since: datetime | int | None = None,
+        until: datetime | int | None = None,
+    ) -> UsageRow:
+        """Return a single aggregated row for the period."""
+        rows = self._base_query(_TOTAL_GROUPING, since=since, until=until)
+        if rows:
+            return rows[0]
+        return UsageRow(label="total")
 
+    def _fetch_raw(
+        self,
+        group_by: str,
+        since: datetime | int | None,
+        until: datetime | int | None,
+        limit: int | None,
+    ) -> tuple[_Grouping, list[sqlite3.Row], sqlite3.Row]:
+        """Run the combined grouped + total query and return the raw rows."""
+        grouping = _grouping(group_by)
+        time_clause, params = self._time_filter(since, until)
+        params.append(_sql_limit(limit))
+
+        # The inner ORDER BY ... LIMIT lets the sorter keep only the top
+        # *limit* groups; the window then numbers just those rows.
         sql = f"""
+            WITH {_USAGE_CTE.format(name="m", time_clause=time_clause)},
+            grouped AS ({grouping.select()}),
+            top AS (SELECT * FROM grouped ORDER BY {grouping.order} LIMIT ?)
+            SELECT *, ROW_NUMBER() OVER (ORDER BY {grouping.order}) AS pos FROM top
+            UNION ALL
             SELECT
-                COALESCE(s.title, m.session_id) AS label,
-                COUNT(*)                                           AS calls,
-                COALESCE(SUM(json_extract(m.data, '$.tokens.input')),     0) AS input_tokens,
-                COALESCE(SUM(json_extract(m.data, '$.tokens.output')),    0) AS output_tokens,
-                COALESCE(SUM(json_extract(m.data, '$.tokens.reasoning')), 0) AS reasoning_tokens,
-                COALESCE(SUM(json_extract(m.data, '$.tokens.cache.read')),  0) AS cache_read,
-                COALESCE(SUM(json_extract(m.data, '$.tokens.cache.write')), 0) AS cache_write,
-                COALESCE(SUM(json_extract(m.data, '$.tokens.total')),    0) AS total_tokens,
-                COALESCE(SUM(json_extract(m.data, '$.cost')),            0) AS cost
-            FROM message m
-            LEFT JOIN session s ON m.session_id = s.id
-            WHERE json_extract(m.data, '$.role') = 'assistant'
-              AND json_extract(m.data, '$.tokens.total') IS NOT NULL
-              {time_clause}
-            GROUP BY m.session_id
-            ORDER BY total_tokens DESC
+                'total' AS label,
+                NULL AS detail,
+                {_TOTAL_AGGREGATES},
+                0 AS pos
+            FROM grouped
+            ORDER BY pos
         """
-        if limit:
-            sql += " LIMIT ?"
-            params.append(limit)
 
-        conn = self._connect()
-        try:
-            rows = conn.execute(sql, params).fetchall()
-        finally:
-            conn.close()
+        total_row, *rows = self._connect().execute(sql, params)
+        return grouping, rows, total_row
 
-        return [
-            UsageRow(
-                label=r["label"] or "(untitled)",
-                calls=r["calls"],
-                tokens=TokenStats(
-                    input=r["input_tokens"],
-                    output=r["output_tokens"],
-                    reasoning=r["reasoning_tokens"],
-                    cache_read=r["cache_read"],
-                    cache_write=r["cache_write"],
-                    total=r["total_tokens"],
-                ),
-                cost=r["cost"],
+    def fetch(
+        self,
+        group_by: str,
+        since: datetime | int | None = None,
+        until: datetime | int | None = None,
+        limit: int | None = None,
+    ) -> tuple[list[UsageRow], UsageRow]:
+        """Return ``(rows, total)`` for *group_by* from a single scan.
+
+        The total is summed from the grouped rows before *limit* applies, so
+        it matches :meth:`totals` for the same period.
+        """
+        grouping, rows, total_row = self._fetch_raw(group_by, since, until, limit)
+        return (
+            [_usage_row(r, r["label"] or grouping.unknown, r["detail"]) for r in rows],
+            _usage_row(total_row, "total"),
+        )
+
+    def fetch_dicts(
+        self,
+        group_by: str,
+        since: datetime | int | None = None,
+        until: datetime | int | None = None,
+        limit: int | None = None,
+    ) -> tuple[list[dict[str, Any]], dict[str, Any]]:
+        """Like :meth:`fetch`, but serialized for JSON without building ``UsageRow``s."""
+        grouping, rows, total_row = self._fetch_raw(group_by, since, until, limit)
+        return (
+            [_usage_dict(r, r["label"] or grouping.unknown, r["detail"]) for r in rows],
+            _usage_dict(total_row, "total"),
+        )
+
+    def _compare_raw(
+        self,
+        group_by: str,
+        since: datetime | int,
+        prev_since: datetime | int,
+        until: datetime | int | None,
+        limit: int | None,
+    ) -> tuple[_Grouping, list[sqlite3.Row], list[sqlite3.Row]]:
+        """Run the single-scan period comparison and return raw rows per period.
+
+        Each list starts with that period's total row, followed by its top
+        *limit* groups. Current-period rows carry a ``delta`` column.
+        """
+        grouping = _grouping(group_by)
+        since_ms = to_ms(since)
+        # One scan of [prev_since, until); the CTE is referenced twice, so
+        # SQLite materializes it instead of re-reading message per period.
+        time_clause, params = self._time_filter(prev_since, until)
+        params += [since_ms, since_ms, _sql_limit(limit), _sql_limit(limit)]
+
+        sql = f"""
+            WITH {_USAGE_CTE.format(name="both_periods", time_clause=time_clause)},
+            m AS (SELECT * FROM both_periods WHERE created >= ?),
+            pm AS (SELECT * FROM both_periods WHERE created < ?),
+            grouped AS ({grouping.select()}),
+            prev_grouped AS ({grouping.select("pm")}),
+            prev AS (
+                SELECT label, detail, SUM(total_tokens) AS total_tokens
+                FROM prev_grouped
+                GROUP BY label, detail
+            ),
+            joined AS (
+                SELECT
+                    g.*,
+                    CASE WHEN p.total_tokens > 0
+                        THEN (g.total_tokens - p.total_tokens) * 100.0 / p.total_tokens
+                    END AS delta
+                FROM grouped g
+                LEFT JOIN prev p ON p.label IS g.label AND p.detail IS g.detail
+            ),
+            top AS (SELECT * FROM joined ORDER BY {grouping.order} LIMIT ?),
+            prev_top AS (
+                SELECT *, NULL AS delta FROM prev_grouped ORDER BY {grouping.order} LIMIT ?
             )
-            for r in rows
-        ]
+            SELECT *, ROW_NUMBER() OVER (ORDER BY {grouping.order}) AS pos, 'cur' AS period
+            FROM top
+            UNION ALL
+            SELECT *, ROW_NUMBER() OVER (ORDER BY {grouping.order}), 'prev' FROM prev_top
+            UNION ALL
+            SELECT 'total', NULL, {_TOTAL_AGGREGATES}, NULL, 0, 'cur' FROM grouped
+            UNION ALL
+            SELECT 'total', NULL, {_TOTAL_AGGREGATES}, NULL, 0, 'prev' FROM prev_grouped
+            ORDER BY period, pos
+        """
 
-    def totals(
+        current: list[sqlite3.Row] = []
+        previous: list[sqlite3.Row] = []
+        for r in self._connect().execute(sql, params):
+            (current if r["period"] == "cur" else previous).append(r)
+        return grouping, current, previous
+
+    def fetch_with_deltas(
         self,
-        since: datetime | None = None,
-        until: datetime | None = None,
-    ) -> UsageRow:
-        """Return a single aggregated row for the period."""
-        rows = self._base_query(
-            group_expr="'total'",
-            since=since,
-            until=until,
+        group_by: str,
+        since: datetime | int,
+        prev_since: datetime | int,
+        until: datetime | int | None = None,
+        limit: int | None = None,
+    ) -> tuple[list[UsageRow], list[float | None], UsageRow, UsageRow]:
+        """Compare ``[since, until)`` with ``[prev_since, since)`` in one scan.
+
+        Returns ``(rows, deltas, total, prev_total)``. Each delta is the percent
+        change in total tokens against the previous-period row with the same
+        label and detail, or *None* when that row is missing or zero.
+        """
+        grouping, (total_row, *rows), (prev_total_row, *_) = self._compare_raw(
+            group_by, since, prev_since, until, limit
+        )
+        return (
+            [_usage_row(r, r["label"] or grouping.unknown, r["detail"]) for r in rows],
+            [r["delta"] for r in rows],
+            _usage_row(total_row, "total"),
+            _usage_row(prev_total_row, "total"),
+        )
+
+    def compare_dicts(
+        self,
+        group_by: str,
+        since: datetime | int,
+        prev_since: datetime | int,
+        until: datetime | int | None = None,
+        limit: int | None = None,
+    ) -> tuple[list[dict[str, Any]], dict[str, Any], list[dict[str, Any]], dict[str, Any]]:
+        """JSON form of a period comparison: ``(rows, total, prev_rows, prev_total)``."""
+        grouping, (total_row, *rows), (prev_total_row, *prev_rows) = self._compare_raw(
+            group_by, since, prev_since, until, limit
+        )
+        return (
+            [_usage_dict(r, r["label"] or grouping.unknown, r["detail"]) for r in rows],
+            _usage_dict(total_row, "total"),
+            [_usage_dict(r, r["label"] or grouping.unknown, r["detail"]) for r in prev_rows],
+            _usage_dict(prev_total_row, "total"),
         )
-        if rows:
-            return rows[0]
-        return UsageRow(label="total")
 
     def to_dicts(self, rows: list[UsageRow]) -> list[dict[str, Any]]:
         """Serialize rows for JSON output."""
@@ -370,19 +636,12 @@ class OpenCodeDB:
                 {time_clause}
             GROUP BY s.id
             ORDER BY total_tokens DESC
+            LIMIT ?
         """
-        if limit:
-            sql += " LIMIT ?"
-            params.append(limit)
-
-        conn = self._connect()
-        try:
-            rows = conn.execute(sql, params).fetchall()
-        finally:
-            conn.close()
+        params.append(_sql_limit(limit))
 
         result: list[SessionMeta] = []
-        for r in rows:
+        for r in self._connect().execute(sql, params):
             start_ms = r["start_ms"]
             end_ms = r["end_ms"]
             if start_ms is not None:
@@ -432,14 +691,8 @@ class OpenCodeDB:
             GROUP BY model
         """
 
-        conn = self._connect()
-        try:
-            rows = conn.execute(sql, params).fetchall()
-        finally:
-            conn.close()
-
         result: dict[str, float] = {}
-        for r in rows:
+        for r in self._connect().execute(sql, params):
             model = r["model"]
             cache_read = r["cache_read"]
             input_tokens = r["input_tokens"]
@@ -468,14 +721,8 @@ class OpenCodeDB:
             GROUP BY model
         """
 
-        conn = self._connect()
-        try:
-            rows = conn.execute(sql, params).fetchall()
-        finally:
-            conn.close()
-
         result: dict[str, float] = {}
-        for r in rows:
+        for r in self._connect().execute(sql, params):
             model = r["model"]
             total_tokens = r["total_tokens"]
             if model and total_tokens > 0:
@@ -496,14 +743,8 @@ class OpenCodeDB:
             GROUP BY tool_name
         """
 
-        conn = self._connect()
-        try:
-            rows = conn.execute(sql).fetchall()
-        finally:
-            conn.close()
-
         result: dict[str, float] = {}
-        for r in rows:
+        for r in self._connect().execute(sql):
             tool_name = r["tool_name"]
             total_calls = r["total_calls"]
             if tool_name and total_calls > 0:
@@ -527,14 +768,8 @@ class OpenCodeDB:
             GROUP BY parent_agent, child_agent
         """
 
-        conn = self._connect()
-        try:
-            rows = conn.execute(sql).fetchall()
-        finally:
-            conn.close()
-
         result: dict[str, list[str]] = {}
-        for r in rows:
+        for r in self._connect().execute(sql):
             parent = r["parent_agent"]
             child = r["child_agent"]
             if parent and child:
@@ -549,14 +784,8 @@ class OpenCodeDB:
             ORDER BY time_created ASC
         """
 
-        conn = self._connect()
-        try:
-            rows = conn.execute(sql, [session_id]).fetchall()
-        finally:
-            conn.close()
-
         parts: list[str] = []
-        for r in rows:
+        for r in self._connect().execute(sql, [session_id]):
             try:
                 d = json.loads(r["data"])
             except (json.JSONDecodeError, TypeError):
@@ -601,10 +830,4 @@ class OpenCodeDB:
             ORDER BY time_created ASC
         """
 
-        conn = self._connect()
-        try:
-            rows = conn.execute(sql, [session_id]).fetchall()
-        finally:
-            conn.close()
-
-        return [r["text"] for r in rows if r["text"]]
+        return [r["text"] for r in self._connect().execute(sql, [session_id]) if r["text"]]
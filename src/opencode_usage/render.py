@@ -2,36 +2,49 @@
 
 from __future__ import annotations
 
+import re
+from functools import lru_cache
+from itertools import chain, product, repeat
 from typing import TYPE_CHECKING
 
-from rich.console import Console
+from rich.cells import cell_len, set_cell_size
+from rich.console import Console, Group
 from rich.panel import Panel
 from rich.table import Table
 from rich.text import Text
 
 if TYPE_CHECKING:
+    from collections.abc import Callable
+
     from .db import UsageRow
 
 console = Console()
 
 
+_TOKEN_UNITS = ((1_000_000_000, "B"), (1_000_000, "M"), (1_000, "K"))
+# Counts below 1K print as-is; prebuilt so the common small values skip str().
+_SMALL_TOKEN_STRS = tuple(str(i) for i in range(1_000))
+
+
+@lru_cache(maxsize=1024)
 def _fmt_tokens(n: int) -> str:
-    """Human-readable token count."""
-    if n >= 1_000_000_000:
-        return f"{n / 1_000_000_000:.1f}B"
-    if n >= 1_000_000:
-        return f"{n / 1_000_000:.1f}M"
-    if n >= 1_000:
-        return f"{n / 1_000:.1f}K"
+    """Human-readable token count, rounded half-up to one decimal."""
+    # SQLite SUMs come back REAL if any token field was stored as one.
+    n = int(n)
+    if 0 <= n < 1_000:
+        return _SMALL_TOKEN_STRS[n]
+    for unit, suffix in _TOKEN_UNITS:
+        if n >= unit:
+            tenths = (n * 10 + unit // 2) // unit
+            return f"{tenths // 10}.{tenths % 10}{suffix}"
     return str(n)
 
 
+@lru_cache(maxsize=512)
 def _fmt_cost(c: float) -> str:
-    if c == 0:
+    if not c:
         return "-"
-    if c < 0.01:
-        return f"${c:.4f}"
-    return f"${c:.2f}"
+    return f"${c:.{4 if c < 0.01 else 2}f}"
 
 
 _BAR_FULL = "█"
@@ -43,40 +56,170 @@ def _spark_bar(value: int, max_value: int, width: int = _BAR_WIDTH_DEFAULT) -> s
     """Horizontal bar proportional to value/max, fixed *width* characters."""
     if width < 1:
         width = 1
-    if max_value <= 0 or value <= 0:
-        return _BAR_EMPTY * width
-    filled = max(1, round(value / max_value * width))
-    filled = min(filled, width)
-    return _BAR_FULL * filled + _BAR_EMPTY * (width - filled)
+    bars = _spark_bars(width)
+    if value <= 0 or max_value <= 0:
+        return bars[0]
+    if value >= max_value:
+        return bars[width]
+    # Integer round-half-even of value * width / max_value, like round() on the
+    # exact ratio but without float division.
+    filled, rem = divmod(value * width, max_value)
+    if 2 * rem > max_value or (2 * rem == max_value and filled & 1):
+        filled += 1
+    return bars[filled or 1]
+
+
+@lru_cache(maxsize=16)
+def _spark_bars(width: int) -> tuple[str, ...]:
+    """Every bar of *width* cells, indexed by the number of filled cells."""
+    full, empty = _BAR_FULL * width, _BAR_EMPTY * width
+    return tuple(full[:filled] + empty[filled:] for filled in range(width + 1))
 
 
 def _fmt_delta(pct: float) -> str:
     """Format a percentage delta with color and arrow."""
+    # Cache on the displayed whole percent; the sign keeps "↑0%" for tiny rises.
+    return _fmt_delta_int(round(pct), (pct > 0) - (pct < 0))
+
+
+@lru_cache(maxsize=512)
+def _fmt_delta_int(ipct: int, sign: int) -> str:
+    """Markup for a delta already rounded to *ipct* percent with the given *sign*."""
+    if sign > 0:
+        return f"[red]↑{ipct}%[/]"
+    if sign < 0:
+        return f"[green]↓{-ipct}%[/]"
+    return "[dim]→0%[/]"
+
+
+def _fmt_delta_text(pct: float) -> Text:
+    """Like :func:`_fmt_delta`, but as styled ``Text`` so no markup is parsed."""
     if pct > 0:
-        return f"[red]↑{pct:.0f}%[/]"
+        return Text(f"↑{pct:.0f}%", style="red")
     if pct < 0:
-        return f"[green]↓{abs(pct):.0f}%[/]"
-    return "[dim]→0%[/]"
+        return Text(f"↓{abs(pct):.0f}%", style="green")
+    return Text("→0%", style="dim")
+
 
+# Vendor prefix: "vendor-variant-1-2-20251016" → "variant-1-2"
+_VENDOR_RE = re.compile(r"\w+-([a-z]\w+)-(\d+-\d+)(?:-\d+)?$")
 
+
+@lru_cache(maxsize=256)
 def _short_model(name: str) -> str:
     """Abbreviate common model names to save table width."""
-    import re
-
-    # Strip vendor prefix: "vendor-variant-1-2-20251016" → "variant-1-2"
-    m = re.match(r"\w+-([a-z]\w+)-(\d+-\d+)(?:-\d+)?$", name)
+    m = _VENDOR_RE.match(name)
     if m:
         return f"{m.group(1)}-{m.group(2)}"
 
     # gemini-3-pro-preview → gemini-3-pro
-    name = re.sub(r"-preview$", "", name)
+    name = name.removesuffix("-preview")
     # grok-code-fast-1 → grok-fast-1
     name = name.replace("grok-code-", "grok-")
     # minimax-m2.5-free → minimax-m2.5
-    name = re.sub(r"-free$", "", name)
+    name = name.removesuffix("-free")
     return name
 
 
+def _row_builder(show_detail: bool, show_breakdown: bool) -> Callable[[UsageRow, str], list[str]]:
+    """Pick the label-to-cost cell builder for a table layout once, outside the row loop."""
+    # Closure cells instead of module globals in the per-row calls
+    fmt_tokens, fmt_cost, short_model = _fmt_tokens, _fmt_cost, _short_model
+
+    if show_breakdown:
+
+        def numbers(r: UsageRow) -> list[str]:
+            t = r.tokens
+            return [
+                str(r.calls),
+                fmt_tokens(t.input),
+                fmt_tokens(t.output),
+                fmt_tokens(t.cache_read),
+                fmt_tokens(t.cache_write),
+                fmt_tokens(t.total),
+                fmt_cost(r.cost),
+            ]
+    else:
+
+        def numbers(r: UsageRow) -> list[str]:
+            return [str(r.calls), fmt_tokens(r.tokens.total), fmt_cost(r.cost)]
+
+    if show_detail:
+
+        def cells(r: UsageRow, label: str) -> list[str]:
+            detail = r.detail
+            return [label, short_model(detail) if detail else "", *numbers(r)]
+
+        return cells
+    return lambda r, label: [label, *numbers(r)]
+
+
+# Each column has ~3 chars overhead (padding + border).
+_COL_OVERHEAD = 3
+# Label column max width without / with the detail column, and the detail max.
+_LABEL_MAX = 30
+_LABEL_MAX_WITH_DETAIL = 24
+_DETAIL_MAX = 18
+
+
+def _fixed_width(show_breakdown: bool, show_detail: bool, has_deltas: bool) -> int:
+    """Estimate fixed column widths (content + padding + borders) for a layout."""
+    width = (_LABEL_MAX_WITH_DETAIL if show_detail else _LABEL_MAX) + _COL_OVERHEAD  # label
+    if show_detail:
+        width += _DETAIL_MAX + _COL_OVERHEAD
+    width += 5 + _COL_OVERHEAD  # Calls
+    if show_breakdown:
+        width += (6 + _COL_OVERHEAD) * 4  # Input, Output, Cache R, Cache W
+    width += (7 + _COL_OVERHEAD) * 2  # Total, Cost
+    if has_deltas:
+        width += 6 + _COL_OVERHEAD
+    return width + 4  # table outer borders + edge padding
+
+
+# Every (show_breakdown, show_detail, has_deltas) layout, computed at import.
+_FIXED_WIDTHS = {layout: _fixed_width(*layout) for layout in product((False, True), repeat=3)}
+
+
+def _plain_cell(cell: str, max_width: int | None) -> str:
+    """Strip markup from a cell and truncate it like Rich's ``max_width``."""
+    if "[" in cell:
+        cell = Text.from_markup(cell).plain
+    if max_width is not None and cell_len(cell) > max_width:
+        cell = set_cell_size(cell, max_width - 1) + "…"
+    return cell
+
+
+def _render_table_plain(table: Table, rows: list[list[str] | None]) -> str:
+    """Render *table*'s columns and *rows* as unstyled text in a single pass.
+
+    ``None`` rows become separator lines, as ``Table.add_section`` does.
+    """
+    columns = table.columns
+    body = [
+        [_plain_cell(c, col.max_width) for c, col in zip(cols, columns, strict=True)]
+        for cols in rows
+        if cols is not None
+    ]
+    headers = [str(col.header) for col in columns]
+    # Widths are terminal cells, not code points, so wide (e.g. CJK) labels line up.
+    widths = [max([cell_len(h), *(cell_len(r[i]) for r in body)]) for i, h in enumerate(headers)]
+    right = [col.justify == "right" for col in columns]
+
+    def line(cells: list[str]) -> str:
+        return " │ ".join(
+            " " * (w - cell_len(c)) + c if r else set_cell_size(c, w)
+            for c, w, r in zip(cells, widths, right, strict=True)
+        ).rstrip()
+
+    sep = "─┼─".join("─" * w for w in widths)
+    title = str(table.title)
+    out = [(" " * ((len(sep) - cell_len(title)) // 2) + title).rstrip(), line(headers), sep]
+    it = iter(body)
+    for cols in rows:
+        out.append(sep if cols is None else line(next(it)))
+    return "\n".join(out)
+
+
 def _make_table(
     title: str,
     label_header: str,
@@ -85,7 +228,7 @@ def _make_table(
     show_detail: str | None = None,
     trend_values: list[int] | None = None,
     deltas: list[float | None] | None = None,
-) -> Table:
+) -> Table | Text:
     table = Table(
         title=title,
         show_header=True,
@@ -95,30 +238,17 @@ def _make_table(
         pad_edge=True,
     )
 
-    label_max = 24 if show_detail else 30
-    detail_max = 18 if show_detail else 0
+    label_max = _LABEL_MAX_WITH_DETAIL if show_detail else _LABEL_MAX
 
-    # Estimate fixed column widths (content + padding + borders)
-    # Each column has ~3 chars overhead (padding + border).
-    col_overhead = 3
-    fixed_width = label_max + col_overhead  # label
-    if show_detail:
-        fixed_width += detail_max + col_overhead
-    fixed_width += 5 + col_overhead  # Calls
-    if show_breakdown:
-        fixed_width += (6 + col_overhead) * 4  # Input, Output, Cache R, Cache W
-    fixed_width += (7 + col_overhead) * 2  # Total, Cost
-    if deltas is not None:
-        fixed_width += 6 + col_overhead
-    fixed_width += 4  # table outer borders + edge padding
+    fixed_width = _FIXED_WIDTHS[show_breakdown, bool(show_detail), deltas is not None]
 
     # Compute trend bar width from remaining terminal space
     term_width = console.width or 80
-    bar_width = min(24, max(_BAR_WIDTH_DEFAULT, term_width - fixed_width - col_overhead))
+    bar_width = min(24, max(_BAR_WIDTH_DEFAULT, term_width - fixed_width - _COL_OVERHEAD))
 
     table.add_column(label_header, style="bold", no_wrap=True, max_width=label_max)
     if show_detail:
-        table.add_column(show_detail, style="dim cyan", no_wrap=True, max_width=detail_max)
+        table.add_column(show_detail, style="dim cyan", no_wrap=True, max_width=_DETAIL_MAX)
     table.add_column("Calls", justify="right", style="magenta", min_width=5)
     if show_breakdown:
         table.add_column("Input", justify="right", style="green", min_width=6)
@@ -132,89 +262,96 @@ def _make_table(
     if deltas is not None:
         table.add_column("Δ", justify="right", min_width=6)
 
-    # Precompute max for sparkline
+    # Every Trend bar is scaled against the largest value, found once per table
     trend_max = max(trend_values) if trend_values else 0
 
+    row_cells = _row_builder(bool(show_detail), show_breakdown)
+
+    # Pad trend/delta lists so a short list leaves the remaining rows blank
+    trend_iter = chain(trend_values or (), repeat(0))
+    delta_iter = chain(deltas or (), repeat(None))
+
+    # Build every row's cells first (None marks an agent section break), then
+    # hand them to Rich in one tight loop over bound methods.
+    pending: list[list[str] | None] = []
     # Track previous label for deduplication + group separators
     prev_label = None
-    for _i, r in enumerate(rows):
+    for r, tv, d in zip(rows, trend_iter, delta_iter, strict=False):
+        label = r.label
         # Insert blank separator between agent groups
-        if show_detail and prev_label is not None and r.label != prev_label:
-            table.add_section()
-
-        display_label = r.label if r.label != prev_label else ""
-        prev_label = r.label
-
-        cols: list[str] = [display_label]
-        if show_detail:
-            cols.append(_short_model(r.detail) if r.detail else "")
-        cols.append(str(r.calls))
-        if show_breakdown:
-            cols.extend(
-                [
-                    _fmt_tokens(r.tokens.input),
-                    _fmt_tokens(r.tokens.output),
-                    _fmt_tokens(r.tokens.cache_read),
-                    _fmt_tokens(r.tokens.cache_write),
-                ]
-            )
-        cols.extend([_fmt_tokens(r.tokens.total), _fmt_cost(r.cost)])
+        if show_detail and prev_label is not None and label != prev_label:
+            pending.append(None)
+
+        cols = row_cells(r, label if label != prev_label else "")
+        prev_label = label
         if trend_values is not None:
-            tv = trend_values[_i] if _i < len(trend_values) else 0
             cols.append(_spark_bar(tv, trend_max, bar_width))
         if deltas is not None:
-            d = deltas[_i] if _i < len(deltas) else None
             cols.append(_fmt_delta(d) if d is not None else "[dim]-[/]")
-        table.add_row(*cols)
+        pending.append(cols)
+
+    # Uncolored, piped output (e.g. NO_COLOR=1 ... | less) skips Rich's
+    # measurement and styling passes entirely.
+    if console.no_color and not console.is_terminal:
+        return Text(_render_table_plain(table, pending), no_wrap=True, overflow="ignore")
+
+    add_row, add_section = table.add_row, table.add_section
+    for cols in pending:
+        if cols is None:
+            add_section()
+        else:
+            add_row(*cols)
 
     return table
 
 
-def render_summary(
+def _summary_panel(
     total: UsageRow,
     period: str,
     prev_total: UsageRow | None = None,
-) -> None:
-    """Print a one-line summary panel."""
+) -> Panel:
+    """Build the one-line summary panel."""
     text = Text()
     text.append("  Calls: ", style="dim")
     text.append(f"{total.calls:,}", style="bold magenta")
     if prev_total is not None and prev_total.calls > 0:
         pct = (total.calls - prev_total.calls) / prev_total.calls * 100
-        text.append(Text.from_markup(f" {_fmt_delta(pct)}"))
+        text.append(" ")
+        text.append_text(_fmt_delta_text(pct))
     text.append("  │  Tokens: ", style="dim")
     text.append(_fmt_tokens(total.tokens.total), style="bold white")
     if prev_total is not None and prev_total.tokens.total > 0:
         pct = (total.tokens.total - prev_total.tokens.total) / prev_total.tokens.total * 100
-        text.append(Text.from_markup(f" {_fmt_delta(pct)}"))
+        text.append(" ")
+        text.append_text(_fmt_delta_text(pct))
     text.append("  │  Cost: ", style="dim")
     text.append(_fmt_cost(total.cost), style="bold red")
     if prev_total is not None and prev_total.cost > 0:
         pct = (total.cost - prev_total.cost) / prev_total.cost * 100
-        text.append(Text.from_markup(f" {_fmt_delta(pct)}"))
-    console.print(Panel(text, title=f"[bold]OpenCode Usage — {period}[/bold]", border_style="blue"))
+        text.append(" ")
+        text.append_text(_fmt_delta_text(pct))
+    return Panel(text, title=f"[bold]OpenCode Usage — {period}[/bold]", border_style="blue")
 
 
-def render_daily(rows: list[UsageRow], period: str) -> None:
-    """Render the daily breakdown table."""
+def _daily_table(rows: list[UsageRow], period: str) -> Table | Text:
+    """Build the daily breakdown table."""
     trend = [r.tokens.total for r in rows]
-    table = _make_table(
+    return _make_table(
         title=f"Daily Usage ({period})",
         label_header="Date",
         rows=rows,
         show_breakdown=True,
         trend_values=trend,
     )
-    console.print(table)
 
 
-def render_grouped(
+def _grouped_table(
     rows: list[UsageRow],
     group_by: str,
     period: str,
     deltas: list[float | None] | None = None,
-) -> None:
-    """Render a grouped breakdown table."""
+) -> Table | Text:
+    """Build a grouped breakdown table."""
     label_map = {
         "model": "Model",
         "agent": "Agent",
@@ -229,7 +366,7 @@ def render_grouped(
     # For agent view, show model as an extra column
     show_detail = "Model" if group_by == "agent" else None
 
-    table = _make_table(
+    return _make_table(
         title=f"Usage by {label_header} ({period})",
         label_header=label_header,
         rows=rows,
@@ -237,4 +374,43 @@ def render_grouped(
         show_detail=show_detail,
         deltas=deltas,
     )
-    console.print(table)
+
+
+def render_summary(
+    total: UsageRow,
+    period: str,
+    prev_total: UsageRow | None = None,
+) -> None:
+    """Print a one-line summary panel."""
+    console.print(_summary_panel(total, period, prev_total))
+
+
+def render_daily(rows: list[UsageRow], period: str) -> None:
+    """Render the daily breakdown table."""
+    console.print(_daily_table(rows, period), crop=False)
+
+
+def render_grouped(
+    rows: list[UsageRow],
+    group_by: str,
+    period: str,
+    deltas: list[float | None] | None = None,
+) -> None:
+    """Render a grouped breakdown table."""
+    console.print(_grouped_table(rows, group_by, period, deltas), crop=False)
+
+
+def render_report(
+    total: UsageRow,
+    rows: list[UsageRow],
+    group_by: str,
+    period: str,
+    prev_total: UsageRow | None = None,
+    deltas: list[float | None] | None = None,
+) -> None:
+    """Print the summary panel and the breakdown table in a single write."""
+    if group_by == "day":
+        table = _daily_table(rows, period)
+    else:
+        table = _grouped_table(rows, group_by, period, deltas)
+    console.print(Group(_summary_panel(total, period, prev_total), "", table), crop=False)
@@ -5,15 +5,18 @@ from __future__ import annotations
 import pytest
 
 from opencode_usage._opencode_cli import _run_db_path, _run_debug_paths
+from opencode_usage.db import _default_db_path
 
 
 @pytest.fixture(autouse=True)
 def _clear_cli_caches() -> None:
     """Clear lru_cache on CLI helpers before every test.
 
-    The ``_opencode_cli`` module caches subprocess results with ``lru_cache``.
+    The ``_opencode_cli`` module caches subprocess results and ``db`` caches
+    the resolved database path with ``lru_cache``.
     Without clearing between tests, a cached value from one test leaks into
     the next, causing non-deterministic failures.
     """
     _run_db_path.cache_clear()
     _run_debug_paths.cache_clear()
+    _default_db_path.cache_clear()
@@ -3,21 +3,27 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
+import io
 import json
 import sqlite3
+import sys
 from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Any
+from unittest.mock import patch
 
 import pytest
+from rich.console import Console
 
+from opencode_usage import render
 from opencode_usage.cli import (
     _build_parser,
-    _compute_deltas,
-    _fetch_rows,
     _parse_since,
     _resolve_since,
+    _write_json,
+    main,
 )
-from opencode_usage.db import OpenCodeDB, TokenStats, UsageRow
 
 # ── _parse_since ─────────────────────────────────────────────
 
@@ -195,79 +201,55 @@ class TestResolveSince:
         assert abs((since - expected).total_seconds()) < 2
         assert period == "Last 7 days"
 
+    def test_clock_not_frozen_between_calls(self):
+        with patch("opencode_usage.cli.datetime") as mock_dt:
+            mock_dt.now.return_value.astimezone.side_effect = [
+                datetime(2025, 3, 10, 12, 0).astimezone(),
+                datetime(2025, 3, 11, 12, 0).astimezone(),
+            ]
+            ns = argparse.Namespace(since=None, days=1)
+            first, _ = _resolve_since(ns)
+            second, _ = _resolve_since(ns)
+        assert second - first == timedelta(days=1)
 
-# ── _compute_deltas ──────────────────────────────────────────
-
-
-class TestComputeDeltas:
-    def test_matching_labels(self):
-        current = [UsageRow(label="model-a", tokens=TokenStats(total=200))]
-        previous = [UsageRow(label="model-a", tokens=TokenStats(total=100))]
-        deltas = _compute_deltas(current, previous)
-        assert len(deltas) == 1
-        assert deltas[0] == pytest.approx(100.0)
-
-    def test_missing_label_returns_none(self):
-        current = [UsageRow(label="model-a", tokens=TokenStats(total=200))]
-        previous = [UsageRow(label="model-b", tokens=TokenStats(total=100))]
-        deltas = _compute_deltas(current, previous)
-        assert deltas == [None]
-
-    def test_zero_previous_returns_none(self):
-        current = [UsageRow(label="model-a", tokens=TokenStats(total=200))]
-        previous = [UsageRow(label="model-a", tokens=TokenStats(total=0))]
-        deltas = _compute_deltas(current, previous)
-        assert deltas == [None]
-
-    def test_negative_delta(self):
-        current = [UsageRow(label="x", tokens=TokenStats(total=50))]
-        previous = [UsageRow(label="x", tokens=TokenStats(total=100))]
-        deltas = _compute_deltas(current, previous)
-        assert deltas[0] == pytest.approx(-50.0)
-
-    def test_detail_included_in_key(self):
-        current = [
-            UsageRow(label="build", detail="model-a", tokens=TokenStats(total=200)),
-        ]
-        previous = [
-            UsageRow(label="build", detail="model-a", tokens=TokenStats(total=100)),
-        ]
-        deltas = _compute_deltas(current, previous)
-        assert deltas[0] == pytest.approx(100.0)
-
-    def test_detail_mismatch_returns_none(self):
-        current = [
-            UsageRow(label="build", detail="model-a", tokens=TokenStats(total=200)),
-        ]
-        previous = [
-            UsageRow(label="build", detail="model-b", tokens=TokenStats(total=100)),
-        ]
-        deltas = _compute_deltas(current, previous)
-        assert deltas == [None]
-
-    def test_empty_previous(self):
-        current = [UsageRow(label="x", tokens=TokenStats(total=100))]
-        deltas = _compute_deltas(current, [])
-        assert deltas == [None]
-
-    def test_empty_current(self):
-        previous = [UsageRow(label="x", tokens=TokenStats(total=100))]
-        deltas = _compute_deltas([], previous)
-        assert deltas == []
-
-
-# ── _fetch_rows ──────────────────────────────────────────────
+    def test_uses_given_now(self):
+        now = datetime(2025, 3, 10, 12, 0).astimezone()
+        ns = argparse.Namespace(since=None, days=3)
+        since, _ = _resolve_since(ns, now)
+        assert since == now - timedelta(days=3)
 
 
-def _make_cli_db(tmp_path: Path) -> Path:
-    """Create a minimal test DB for _fetch_rows tests."""
-    db_path = tmp_path / "cli_test.db"
-    conn = sqlite3.connect(str(db_path))
-    conn.execute("CREATE TABLE message (id TEXT PRIMARY KEY, session_id TEXT, data TEXT)")
-    conn.execute("CREATE TABLE session (id TEXT PRIMARY KEY, title TEXT)")
+# ── _write_json ──────────────────────────────────────────────
+
+_JSON_SAMPLE = {"period": "Last 7 days", "rows": [{"label": "Débogage", "cost": 0.0125}]}
+
+
+class TestWriteJson:
+    def test_stdlib_fallback_matches_json_dumps(self, capsys):
+        with patch.dict(sys.modules, {"orjson": None}):
+            _write_json(_JSON_SAMPLE)
+        out = capsys.readouterr().out
+        assert out == json.dumps(_JSON_SAMPLE, indent=2, ensure_ascii=False) + "\n"
+
+    def test_orjson_matches_json_dumps(self, capsys):
+        pytest.importorskip("orjson")
+        _write_json(_JSON_SAMPLE)
+        out = capsys.readouterr().out
+        assert out == json.dumps(_JSON_SAMPLE, indent=2, ensure_ascii=False) + "\n"
 
-    now_ms = int(datetime.now().astimezone().timestamp() * 1000)
-    data = json.dumps(
+    def test_text_only_stdout(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("OPENCODE_DB", str(_make_cli_db(tmp_path)))
+        buf = io.StringIO()
+        with contextlib.redirect_stdout(buf):
+            main(["--json", "--by", "model"])
+        assert [r["label"] for r in json.loads(buf.getvalue())["rows"]] == ["test-model"]
+
+
+# ── main ─────────────────────────────────────────────────────
+
+
+def _cli_msg(created: datetime, model: str) -> str:
+    return json.dumps(
         {
             "role": "assistant",
             "tokens": {
@@ -278,51 +260,108 @@ def _make_cli_db(tmp_path: Path) -> Path:
                 "total": 165,
             },
             "cost": 0.01,
-            "modelID": "test-model",
+            "modelID": model,
             "agent": "build",
             "providerID": "openrouter",
-            "time": {"created": now_ms},
+            "time": {"created": int(created.timestamp() * 1000)},
         }
     )
-    conn.execute("INSERT INTO message VALUES (?, ?, ?)", ("m1", "s1", data))
+
+
+def _make_cli_db(tmp_path: Path) -> Path:
+    """Create a minimal test DB: one message now, one 10 days ago.
+
+    With the default 7-day window the old message lands in the previous
+    period of ``--compare``.
+    """
+    db_path = tmp_path / "cli_test.db"
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("CREATE TABLE message (id TEXT PRIMARY KEY, session_id TEXT, data TEXT)")
+    conn.execute("CREATE TABLE session (id TEXT PRIMARY KEY, title TEXT)")
+
+    now = datetime.now().astimezone()
+    conn.executemany(
+        "INSERT INTO message VALUES (?, ?, ?)",
+        [
+            ("m1", "s1", _cli_msg(now, "test-model")),
+            ("m2", "s1", _cli_msg(now - timedelta(days=10), "old-model")),
+        ],
+    )
     conn.execute("INSERT INTO session VALUES (?, ?)", ("s1", "Test Session"))
     conn.commit()
     conn.close()
     return db_path
 
 
-class TestFetchRows:
-    def test_day(self, tmp_path):
-        db = OpenCodeDB(db_path=_make_cli_db(tmp_path))
-        rows = _fetch_rows(db, "day")
-        assert len(rows) == 1
-
-    def test_model(self, tmp_path):
-        db = OpenCodeDB(db_path=_make_cli_db(tmp_path))
-        rows = _fetch_rows(db, "model")
-        assert len(rows) == 1
-        assert rows[0].label == "test-model"
-
-    def test_agent(self, tmp_path):
-        db = OpenCodeDB(db_path=_make_cli_db(tmp_path))
-        rows = _fetch_rows(db, "agent")
-        assert len(rows) == 1
-        assert rows[0].label == "build"
-        assert rows[0].detail == "test-model"
-
-    def test_provider(self, tmp_path):
-        db = OpenCodeDB(db_path=_make_cli_db(tmp_path))
-        rows = _fetch_rows(db, "provider")
-        assert len(rows) == 1
-        assert rows[0].label == "openrouter"
-
-    def test_session(self, tmp_path):
-        db = OpenCodeDB(db_path=_make_cli_db(tmp_path))
-        rows = _fetch_rows(db, "session")
-        assert len(rows) == 1
-        assert rows[0].label == "Test Session"
-
-    def test_unknown_group_returns_empty(self, tmp_path):
-        db = OpenCodeDB(db_path=_make_cli_db(tmp_path))
-        rows = _fetch_rows(db, "unknown")
-        assert rows == []
+_TOKENS = {
+    "input": 100,
+    "output": 50,
+    "reasoning": 0,
+    "cache_read": 10,
+    "cache_write": 5,
+    "total": 165,
+}
+
+
+def _usage(label: str, **extra: Any) -> dict[str, Any]:
+    return {"label": label, "calls": 1, "tokens": _TOKENS, "cost": 0.01, **extra}
+
+
+class TestMain:
+    @pytest.fixture(autouse=True)
+    def _cli_db(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("OPENCODE_DB", str(_make_cli_db(tmp_path)))
+
+    @staticmethod
+    def _json(capsys, argv: list[str]) -> dict[str, Any]:
+        main(argv)
+        return json.loads(capsys.readouterr().out)
+
+    @staticmethod
+    def _table(monkeypatch, argv: list[str]) -> str:
+        out = io.StringIO()
+        monkeypatch.setattr(render, "console", Console(file=out, width=200, no_color=True))
+        main(argv)
+        return out.getvalue()
+
+    def test_json(self, capsys):
+        assert self._json(capsys, ["--json", "--by", "model"]) == {
+            "period": "Last 7 days",
+            "total": _usage("total"),
+            "rows": [_usage("test-model")],
+        }
+
+    def test_json_empty_window_cost_is_float(self, capsys):
+        main(["--json", "--since", "2999-01-01"])
+        out = capsys.readouterr().out
+        assert json.loads(out)["total"]["calls"] == 0
+        assert '"cost": 0.0' in out
+
+    def test_compare_json_by_model(self, capsys):
+        assert self._json(capsys, ["--compare", "--json", "--by", "model"]) == {
+            "period": "Last 7 days",
+            "total": _usage("total"),
+            "rows": [_usage("test-model")],
+            "previous_total": _usage("total"),
+            "previous_rows": [_usage("old-model")],
+        }
+
+    def test_compare_json_by_day_omits_previous_rows(self, capsys):
+        output = self._json(capsys, ["--compare", "--json"])
+        assert output["previous_total"] == _usage("total")
+        assert "previous_rows" not in output
+        assert [r["calls"] for r in output["rows"]] == [1]
+
+    def test_compare_table_by_agent(self, monkeypatch):
+        out = self._table(monkeypatch, ["--compare", "--by", "agent"])
+        lines = out.splitlines()
+        header = next(line for line in lines if "Agent" in line and "Model" in line)
+        row = next(line for line in lines if "test-model" in line)
+        assert header.rstrip().endswith("Δ")
+        # No previous row for build/test-model → no delta
+        assert row.split("│")[-1].strip() == "-"
+
+    def test_compare_empty_previous_period_drops_deltas(self, monkeypatch):
+        out = self._table(monkeypatch, ["--compare", "--by", "agent", "--days", "1"])
+        assert "test-model" in out
+        assert "Δ" not in out
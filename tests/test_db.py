@@ -3,7 +3,10 @@
 from __future__ import annotations
 
 import json
+import shutil
 import sqlite3
+import time
+from collections.abc import Iterator
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Any
@@ -11,7 +14,21 @@ from unittest.mock import patch
 
 import pytest
 
-from opencode_usage.db import OpenCodeDB, UsageRow, _default_db_path
+from opencode_usage.db import OpenCodeDB, UsageRow, _default_db_path, to_ms
+
+
+def _dumps(data: Any) -> str:
+    """Compact JSON with raw UTF-8, the form OpenCode writes (JSON.stringify)."""
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+# Under `pytest -n auto --dist=loadgroup` this keeps the module on one worker,
+# so the module-scoped seed DB and query fixtures are built only once.
+pytestmark = pytest.mark.xdist_group(name="db_readonly")
+
+# One clock reading for the whole module: the seed rows and every test window
+# are placed relative to it, so they can't drift apart mid-run.
+_NOW = datetime.now().astimezone()
 
 
 def _make_msg(
@@ -49,103 +66,65 @@ def _make_msg(
         "providerID": provider,
         "time": {"created": created_ms},
     }
-    return (msg_id, session_id, json.dumps(data))
+    return (msg_id, session_id, _dumps(data))
 
 
-@pytest.fixture()
-def db_path(tmp_path: Path) -> Path:
-    """Create a populated test DB and return its path."""
-    path = tmp_path / "opencode.db"
+def _connect_scratch(path: Path) -> sqlite3.Connection:
+    """Open a test-owned DB file with journaling and fsync turned off.
+
+    The files are thrown away after the run, so crash safety buys nothing.
+    """
     conn = sqlite3.connect(str(path))
+    conn.execute("PRAGMA journal_mode=MEMORY")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def _build_db(path: Path) -> Path:
+    """Create a populated test DB at *path* and return it.
+
+    The rows are written in memory and copied to *path* with one backup,
+    so the file only sees a single page-level write.
+    """
+    conn = sqlite3.connect(":memory:")
     conn.execute("CREATE TABLE message (id TEXT PRIMARY KEY, session_id TEXT, data TEXT)")
     conn.execute("CREATE TABLE session (id TEXT PRIMARY KEY, title TEXT)")
 
-    now = datetime.now(tz=timezone.utc)
-    today_ms = int(now.timestamp() * 1000)
-    yesterday_ms = int((now - timedelta(days=1)).timestamp() * 1000)
-    old_ms = int((now - timedelta(days=10)).timestamp() * 1000)
+    today_ms = int(_NOW.timestamp() * 1000)
+    yesterday_ms = int((_NOW - timedelta(days=1)).timestamp() * 1000)
+    old_ms = int((_NOW - timedelta(days=10)).timestamp() * 1000)
 
-    messages = [
+    # (id, session, agent, model, provider, total_tok, cost, created_ms, role)
+    specs = [
         # Today — session s1
-        _make_msg(
-            "m1",
-            "s1",
-            agent="build",
-            model="deepseek-r1",
-            provider="openrouter",
-            total_tok=1000,
-            cost=0.05,
-            created_ms=today_ms,
-        ),
-        _make_msg(
-            "m2",
-            "s1",
-            agent="build",
-            model="deepseek-r1",
-            provider="openrouter",
-            total_tok=500,
-            cost=0.02,
-            created_ms=today_ms,
-        ),
-        _make_msg(
-            "m3",
-            "s1",
-            agent="explore",
-            model="gemma-3",
-            provider="google",
-            total_tok=800,
-            cost=0.0,
-            created_ms=today_ms,
-        ),
+        ("m1", "s1", "build", "deepseek-r1", "openrouter", 1000, 0.05, today_ms, "assistant"),
+        ("m2", "s1", "build", "deepseek-r1", "openrouter", 500, 0.02, today_ms, "assistant"),
+        ("m3", "s1", "explore", "gemma-3", "google", 800, 0.0, today_ms, "assistant"),
         # Yesterday — session s2
-        _make_msg(
-            "m4",
-            "s2",
-            agent="explore",
-            model="qwen-3-coder",
-            provider="alibaba",
-            total_tok=300,
-            cost=0.01,
-            created_ms=yesterday_ms,
-        ),
-        _make_msg(
-            "m5",
-            "s2",
-            agent="oracle",
-            model="deepseek-r1",
-            provider="openrouter",
-            total_tok=200,
-            cost=0.0,
-            created_ms=yesterday_ms,
-        ),
+        ("m4", "s2", "explore", "qwen-3-coder", "alibaba", 300, 0.01, yesterday_ms, "assistant"),
+        ("m5", "s2", "oracle", "deepseek-r1", "openrouter", 200, 0.0, yesterday_ms, "assistant"),
         # 10 days ago — session s3
-        _make_msg(
-            "m6",
-            "s3",
-            agent="build",
-            model="deepseek-r1",
-            provider="openrouter",
-            total_tok=9999,
-            cost=1.0,
-            created_ms=old_ms,
-        ),
+        ("m6", "s3", "build", "deepseek-r1", "openrouter", 9999, 1.0, old_ms, "assistant"),
         # User message — should be excluded from all queries
+        ("m7", "s1", "build", "deepseek-r1", "openrouter", 50, 0.0, today_ms, "user"),
+    ]
+    messages = [
         _make_msg(
-            "m7",
-            "s1",
-            agent="build",
-            model="deepseek-r1",
-            provider="openrouter",
-            total_tok=50,
-            cost=0.0,
-            created_ms=today_ms,
-            role="user",
-        ),
+            mid,
+            sid,
+            agent=agent,
+            model=model,
+            provider=provider,
+            total_tok=total_tok,
+            cost=cost,
+            created_ms=created_ms,
+            role=role,
+        )
+        for mid, sid, agent, model, provider, total_tok, cost, created_ms, role in specs
     ]
-    conn.executemany("INSERT INTO message VALUES (?, ?, ?)", messages)
-
     # m8: assistant with missing tokens.total → excluded by IS NOT NULL
-    null_total = json.dumps(
+    null_total = _dumps(
         {
             "role": "assistant",
             "tokens": {"input": 10, "output": 5},
@@ -156,19 +135,122 @@ def db_path(tmp_path: Path) -> Path:
             "time": {"created": today_ms},
         }
     )
-    conn.execute("INSERT INTO message VALUES (?, ?, ?)", ("m8", "s1", null_total))
+    messages.append(("m8", "s1", null_total))
 
-    conn.execute("INSERT INTO session VALUES (?, ?)", ("s1", "Debug Session"))
-    conn.execute("INSERT INTO session VALUES (?, ?)", ("s2", "Feature Work"))
-    conn.execute("INSERT INTO session VALUES (?, ?)", ("s3", "Old Session"))
-    conn.commit()
+    sessions = [("s1", "Debug Session"), ("s2", "Feature Work"), ("s3", "Old Session")]
+
+    # One transaction (and one commit) for all inserts
+    with conn:
+        conn.executemany("INSERT INTO message VALUES (?, ?, ?)", messages)
+        conn.executemany("INSERT INTO session VALUES (?, ?)", sessions)
+    dest = _connect_scratch(path)
+    conn.backup(dest)
+    dest.close()
     conn.close()
     return path
 
 
+# Expected token totals of the valid assistant messages in the seed DB
+_TOTAL_TODAY = 1000 + 500 + 800  # m1 + m2 + m3
+_TOTAL_YESTERDAY = 300 + 200  # m4 + m5
+_TOTAL_OLD = 9999  # m6
+_TOTAL_RECENT = _TOTAL_TODAY + _TOTAL_YESTERDAY
+_TOTAL_ALL = _TOTAL_RECENT + _TOTAL_OLD
+
+
+@pytest.fixture(scope="module")
+def golden_db_path(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """Seed DB built once per module; never opened by tests, only copied."""
+    return _build_db(tmp_path_factory.mktemp("golden") / "opencode.db")
+
+
+@pytest.fixture(scope="module")
+def db_path(tmp_path_factory: pytest.TempPathFactory, golden_db_path: Path) -> Path:
+    """Populated test DB shared by the module; tests must treat it as read-only."""
+    dest = tmp_path_factory.mktemp("db") / "opencode.db"
+    shutil.copyfile(golden_db_path, dest)
+    return dest
+
+
+@pytest.fixture(scope="module")
+def db(db_path: Path) -> Iterator[OpenCodeDB]:
+    """OpenCodeDB over the shared test DB, reused by every read-only query test."""
+    with OpenCodeDB(db_path=db_path) as shared:
+        yield shared
+
+
+@pytest.fixture(scope="module")
+def daily_rows(db: OpenCodeDB) -> list[UsageRow]:
+    return db.daily()
+
+
+@pytest.fixture(scope="module")
+def by_model_rows(db: OpenCodeDB) -> list[UsageRow]:
+    return db.by_model()
+
+
+@pytest.fixture(scope="module")
+def by_agent_rows(db: OpenCodeDB) -> list[UsageRow]:
+    return db.by_agent()
+
+
+@pytest.fixture(scope="module")
+def by_provider_rows(db: OpenCodeDB) -> list[UsageRow]:
+    return db.by_provider()
+
+
+@pytest.fixture(scope="module")
+def by_session_rows(db: OpenCodeDB) -> list[UsageRow]:
+    return db.by_session()
+
+
+@pytest.fixture(scope="module")
+def by_model_index(by_model_rows: list[UsageRow]) -> dict[str, UsageRow]:
+    return {r.label: r for r in by_model_rows}
+
+
+@pytest.fixture(scope="module")
+def by_agent_index(by_agent_rows: list[UsageRow]) -> dict[str, list[str | None]]:
+    """Agent → its model details, in query order."""
+    index: dict[str, list[str | None]] = {}
+    for r in by_agent_rows:
+        index.setdefault(r.label, []).append(r.detail)
+    return index
+
+
+@pytest.fixture(scope="module")
+def by_provider_index(by_provider_rows: list[UsageRow]) -> dict[str, UsageRow]:
+    return {r.label: r for r in by_provider_rows}
+
+
+@pytest.fixture(scope="module")
+def by_session_index(by_session_rows: list[UsageRow]) -> dict[str, UsageRow]:
+    return {r.label: r for r in by_session_rows}
+
+
+@pytest.fixture(scope="module")
+def totals_row(db: OpenCodeDB) -> UsageRow:
+    return db.totals()
+
+
+@pytest.fixture()
+def fresh_db_path(tmp_path: Path, golden_db_path: Path) -> Path:
+    """Private populated test DB for tests that write to it or need it index-free."""
+    dest = tmp_path / "opencode.db"
+    shutil.copyfile(golden_db_path, dest)
+    return dest
+
+
 # ── init ─────────────────────────────────────────────────────
 
 
+def _index_names(path: Path) -> set[str]:
+    conn = sqlite3.connect(str(path))
+    names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    conn.close()
+    return names
+
+
 class TestOpenCodeDBInit:
     def test_missing_db_raises(self, tmp_path):
         with pytest.raises(FileNotFoundError, match="not found"):
@@ -178,28 +260,93 @@ class TestOpenCodeDBInit:
         db = OpenCodeDB(db_path=db_path)
         assert db.path == db_path
 
+    def test_leaves_schema_alone_by_default(self, fresh_db_path, monkeypatch):
+        monkeypatch.delenv("OPENCODE_USAGE_CREATE_INDEX", raising=False)
+        db = OpenCodeDB(db_path=fresh_db_path)
+        assert "idx_message_assistant_created" not in _index_names(fresh_db_path)
+        assert db._conn is None
+
+    def test_creates_created_index_when_opted_in(self, fresh_db_path, monkeypatch):
+        monkeypatch.setenv("OPENCODE_USAGE_CREATE_INDEX", "1")
+        OpenCodeDB(db_path=fresh_db_path)
+        assert "idx_message_assistant_created" in _index_names(fresh_db_path)
+
+    def test_existing_index_skips_read_write_open(self, fresh_db_path, monkeypatch):
+        monkeypatch.setenv("OPENCODE_USAGE_CREATE_INDEX", "1")
+        OpenCodeDB(db_path=fresh_db_path)
+        with patch("opencode_usage.db.os.access") as access:
+            OpenCodeDB(db_path=fresh_db_path)
+        access.assert_not_called()
+
+    def test_reuses_connection(self, db_path):
+        db = OpenCodeDB(db_path=db_path)
+        assert db._connect() is db._connect()
+
+    def test_close_reopens_on_next_query(self, db_path):
+        db = OpenCodeDB(db_path=db_path)
+        first = db._connect()
+        db.close()
+        assert db._conn is None
+        assert db._connect() is not first
+        assert db.totals().calls == 6
+
+    def test_context_manager_closes(self, db_path):
+        with OpenCodeDB(db_path=db_path) as db:
+            assert db.totals().calls == 6
+        assert db._conn is None
+
+    def test_skips_index_when_read_only(self, fresh_db_path, monkeypatch):
+        monkeypatch.setenv("OPENCODE_USAGE_CREATE_INDEX", "1")
+        with patch("opencode_usage.db.os.access", return_value=False):
+            db = OpenCodeDB(db_path=fresh_db_path)
+        assert "idx_message_assistant_created" not in _index_names(fresh_db_path)
+        assert db.totals().calls == 6
+
+    def test_skips_index_without_waiting_when_locked(self, fresh_db_path, monkeypatch):
+        monkeypatch.setenv("OPENCODE_USAGE_CREATE_INDEX", "1")
+        writer = sqlite3.connect(str(fresh_db_path), isolation_level=None)
+        writer.execute("BEGIN IMMEDIATE")  # OpenCode mid-write
+        try:
+            start = time.monotonic()
+            db = OpenCodeDB(db_path=fresh_db_path)
+            assert time.monotonic() - start < 0.5
+            assert db.totals().calls == 6
+            names = {
+                r[0] for r in writer.execute("SELECT name FROM sqlite_master WHERE type='index'")
+            }
+            assert "idx_message_assistant_created" not in names
+        finally:
+            writer.execute("ROLLBACK")
+            writer.close()
+
+
+# ── to_ms ────────────────────────────────────────────────────
+
+
+class TestToMs:
+    def test_datetime_to_epoch_ms(self):
+        assert to_ms(datetime(2025, 1, 1, tzinfo=timezone.utc)) == 1_735_689_600_000
+
+    def test_int_passes_through(self):
+        assert to_ms(1_735_689_600_000) == 1_735_689_600_000
+
 
 # ── daily ────────────────────────────────────────────────────
 
 
 class TestDaily:
-    def test_returns_rows_with_date_labels(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        rows = db.daily()
-        assert len(rows) >= 2  # today + yesterday + old
-        for r in rows:
+    def test_returns_rows_with_date_labels(self, daily_rows):
+        assert len(daily_rows) >= 2  # today + yesterday + old
+        for r in daily_rows:
             assert "-" in r.label  # YYYY-MM-DD
 
-    def test_since_filters_old(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        since = datetime.now().astimezone() - timedelta(days=2)
+    def test_since_filters_old(self, db):
+        since = _NOW - timedelta(days=2)
         rows = db.daily(since=since)
-        total = sum(r.tokens.total for r in rows)
         # old message (9999 tokens) should be excluded
-        assert total == 1000 + 500 + 800 + 300 + 200
+        assert sum(r.tokens.total for r in rows) == _TOTAL_RECENT
 
-    def test_limit(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
+    def test_limit(self, db):
         rows = db.daily(limit=1)
         assert len(rows) == 1
 
@@ -208,31 +355,20 @@ class TestDaily:
 
 
 class TestByModel:
-    def test_groups_by_model(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        rows = db.by_model()
-        labels = {r.label for r in rows}
-        assert "deepseek-r1" in labels
-        assert "gemma-3" in labels
-        assert "qwen-3-coder" in labels
+    def test_groups_by_model(self, by_model_index):
+        assert "deepseek-r1" in by_model_index
+        assert "gemma-3" in by_model_index
+        assert "qwen-3-coder" in by_model_index
 
-    def test_aggregates_tokens(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        rows = db.by_model()
-        dr1 = next(r for r in rows if r.label == "deepseek-r1")
+    def test_aggregates_tokens(self, by_model_index):
         # m1(1000) + m2(500) + m5(200) + m6(9999)
-        assert dr1.tokens.total == 11699
+        assert by_model_index["deepseek-r1"].tokens.total == 11699
 
-    def test_aggregates_cost(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        rows = db.by_model()
-        dr1 = next(r for r in rows if r.label == "deepseek-r1")
-        assert dr1.cost == pytest.approx(0.05 + 0.02 + 0.0 + 1.0)
+    def test_aggregates_cost(self, by_model_index):
+        assert by_model_index["deepseek-r1"].cost == pytest.approx(0.05 + 0.02 + 0.0 + 1.0)
 
-    def test_no_detail_field(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        rows = db.by_model()
-        for r in rows:
+    def test_no_detail_field(self, by_model_rows):
+        for r in by_model_rows:
             assert r.detail is None
 
 
@@ -240,89 +376,60 @@ class TestByModel:
 
 
 class TestByAgent:
-    def test_groups_by_agent_and_model(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        rows = db.by_agent()
-        for r in rows:
+    def test_groups_by_agent_and_model(self, by_agent_rows):
+        for r in by_agent_rows:
             assert r.detail is not None  # model as detail
 
-    def test_build_agent_present(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        rows = db.by_agent()
-        build_rows = [r for r in rows if r.label == "build"]
-        assert len(build_rows) >= 1
-        assert build_rows[0].detail == "deepseek-r1"
+    def test_build_agent_present(self, by_agent_index):
+        assert by_agent_index["build"][0] == "deepseek-r1"
 
-    def test_explore_has_two_models(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        rows = db.by_agent()
-        explore = [r for r in rows if r.label == "explore"]
-        models = {r.detail for r in explore}
-        assert models == {"gemma-3", "qwen-3-coder"}
+    def test_explore_has_two_models(self, by_agent_index):
+        assert set(by_agent_index["explore"]) == {"gemma-3", "qwen-3-coder"}
 
 
 # ── by_provider ──────────────────────────────────────────────
 
 
 class TestByProvider:
-    def test_groups_by_provider(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        rows = db.by_provider()
-        labels = {r.label for r in rows}
-        assert "openrouter" in labels
-        assert "google" in labels
-        assert "alibaba" in labels
+    def test_groups_by_provider(self, by_provider_index):
+        assert "openrouter" in by_provider_index
+        assert "google" in by_provider_index
+        assert "alibaba" in by_provider_index
 
-    def test_openrouter_aggregates(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        rows = db.by_provider()
-        orr = next(r for r in rows if r.label == "openrouter")
+    def test_openrouter_aggregates(self, by_provider_index):
         # m1(1000) + m2(500) + m5(200) + m6(9999)
-        assert orr.tokens.total == 11699
+        assert by_provider_index["openrouter"].tokens.total == 11699
 
 
 # ── by_session ───────────────────────────────────────────────
 
 
 class TestBySession:
-    def test_uses_session_title(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        rows = db.by_session()
-        labels = {r.label for r in rows}
-        assert "Debug Session" in labels
-        assert "Feature Work" in labels
-        assert "Old Session" in labels
+    def test_uses_session_title(self, by_session_index):
+        assert "Debug Session" in by_session_index
+        assert "Feature Work" in by_session_index
+        assert "Old Session" in by_session_index
 
-    def test_session_token_aggregation(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        rows = db.by_session()
-        debug = next(r for r in rows if r.label == "Debug Session")
+    def test_session_token_aggregation(self, by_session_index):
         # s1: m1(1000) + m2(500) + m3(800) = 2300
-        assert debug.tokens.total == 2300
+        assert by_session_index["Debug Session"].tokens.total == 2300
 
 
 # ── totals ───────────────────────────────────────────────────
 
 
 class TestTotals:
-    def test_returns_single_row(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        total = db.totals()
-        assert total.label == "total"
+    def test_returns_single_row(self, totals_row):
+        assert totals_row.label == "total"
         # 6 valid assistant messages
-        assert total.calls == 6
+        assert totals_row.calls == 6
 
-    def test_aggregated_tokens(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        total = db.totals()
-        expected = 1000 + 500 + 800 + 300 + 200 + 9999
-        assert total.tokens.total == expected
+    def test_aggregated_tokens(self, totals_row):
+        assert totals_row.tokens.total == _TOTAL_ALL
 
-    def test_aggregated_cost(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        total = db.totals()
+    def test_aggregated_cost(self, totals_row):
         expected = 0.05 + 0.02 + 0.0 + 0.01 + 0.0 + 1.0
-        assert total.cost == pytest.approx(expected)
+        assert totals_row.cost == pytest.approx(expected)
 
     def test_empty_db_returns_default(self, tmp_path):
         path = tmp_path / "empty.db"
@@ -337,47 +444,167 @@ class TestTotals:
         assert total.label == "total"
         assert total.calls == 0
         assert total.cost == 0.0
+        assert isinstance(total.cost, float)
         assert total.tokens.total == 0
 
 
+# ── _time_filter ─────────────────────────────────────────────
+
+
+class TestTimeFilter:
+    def test_no_bounds(self, db):
+        assert db._time_filter(None, None) == ("", [])
+
+    def test_datetime_and_ms_bounds_agree(self, db):
+        since = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        ms = int(since.timestamp() * 1000)
+        assert db._time_filter(since, since) == db._time_filter(ms, ms)
+        assert db._time_filter(ms)[1] == [ms]
+
+
+# ── fetch ────────────────────────────────────────────────────
+
+
+class TestFetch:
+    def test_rows_match_grouped_query(self, db):
+        rows, _ = db.fetch("model")
+        assert rows == db.by_model()
+
+    def test_total_matches_totals(self, db):
+        _, total = db.fetch("session")
+        assert total == db.totals()
+
+    def test_agent_rows_keep_detail_and_order(self, db):
+        rows, _ = db.fetch("agent")
+        assert rows == db.by_agent()
+
+    def test_limit_does_not_affect_total(self, db):
+        rows, total = db.fetch("day", limit=1)
+        assert len(rows) == 1
+        assert rows == db.daily(limit=1)
+        assert total.tokens.total == _TOTAL_ALL
+
+    def test_time_window(self, db):
+        since = _NOW - timedelta(days=2)
+        rows, total = db.fetch("provider", since=since)
+        assert rows == db.by_provider(since=since)
+        assert total == db.totals(since=since)
+
+    def test_empty_window_returns_zero_total(self, db):
+        ancient = _NOW - timedelta(days=30)
+        rows, total = db.fetch("model", until=ancient)
+        assert rows == []
+        assert total == UsageRow(label="total")
+        assert isinstance(total.cost, float)
+
+    def test_unknown_group_raises(self, db):
+        with pytest.raises(ValueError, match="Unknown group_by"):
+            db.fetch("unknown")
+
+
+# ── fetch_with_deltas ────────────────────────────────────────
+
+
+class TestFetchWithDeltas:
+    @staticmethod
+    def _window() -> tuple[datetime, datetime]:
+        # current = today's messages, previous = yesterday's
+        return _NOW - timedelta(hours=12), _NOW - timedelta(hours=36)
+
+    def test_delta_against_matching_label(self, db):
+        since, prev_since = self._window()
+        rows, deltas, _, _ = db.fetch_with_deltas("model", since=since, prev_since=prev_since)
+        by_label = dict(zip([r.label for r in rows], deltas, strict=True))
+        # deepseek-r1: 1500 now vs 200 before
+        assert by_label["deepseek-r1"] == pytest.approx(650.0)
+        assert by_label["gemma-3"] is None
+
+    def test_rows_match_fetch(self, db):
+        since, prev_since = self._window()
+        rows, deltas, _, _ = db.fetch_with_deltas("session", since=since, prev_since=prev_since)
+        assert rows == db.fetch("session", since=since)[0]
+        assert len(deltas) == len(rows)
+
+    def test_totals_for_both_periods(self, db):
+        since, prev_since = self._window()
+        _, _, total, prev_total = db.fetch_with_deltas(
+            "provider", since=since, prev_since=prev_since
+        )
+        assert total == db.totals(since=since)
+        assert prev_total == db.totals(since=prev_since, until=since)
+
+    def test_detail_mismatch_returns_none(self, db):
+        since, prev_since = self._window()
+        rows, deltas, _, _ = db.fetch_with_deltas("agent", since=since, prev_since=prev_since)
+        # explore used gemma-3 today but qwen-3-coder yesterday
+        assert [r.label for r in rows] == ["build", "explore"]
+        assert deltas == [None, None]
+
+    def test_limit_keeps_totals(self, db):
+        since, prev_since = self._window()
+        rows, deltas, total, _ = db.fetch_with_deltas(
+            "model", since=since, prev_since=prev_since, limit=1
+        )
+        assert [r.label for r in rows] == ["deepseek-r1"]
+        assert deltas == [pytest.approx(650.0)]
+        assert total.tokens.total == _TOTAL_TODAY
+
+    def test_empty_previous_period(self, db):
+        since = _NOW - timedelta(days=30)
+        rows, deltas, _, prev_total = db.fetch_with_deltas(
+            "model", since=since, prev_since=_NOW - timedelta(days=60)
+        )
+        assert rows
+        assert deltas == [None] * len(rows)
+        assert prev_total == UsageRow(label="total")
+        assert isinstance(prev_total.cost, float)
+
+    def test_ms_bounds_match_datetimes(self, db):
+        since, prev_since = self._window()
+        as_ms = int(since.timestamp() * 1000), int(prev_since.timestamp() * 1000)
+        assert db.fetch_with_deltas("model", *as_ms) == db.fetch_with_deltas(
+            "model", since, prev_since
+        )
+
+    def test_compare_dicts_matches_fetch_dicts(self, db):
+        since, prev_since = self._window()
+        rows, total, prev_rows, prev_total = db.compare_dicts(
+            "agent", since=since, prev_since=prev_since
+        )
+        assert (rows, total) == db.fetch_dicts("agent", since=since)
+        assert (prev_rows, prev_total) == db.fetch_dicts("agent", since=prev_since, until=since)
+
+
 # ── until filter ─────────────────────────────────────────────
 
 
 class TestUntilFilter:
-    def test_until_before_all_data(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        ancient = datetime.now().astimezone() - timedelta(days=30)
+    def test_until_before_all_data(self, db):
+        ancient = _NOW - timedelta(days=30)
         total = db.totals(until=ancient)
         assert total.calls == 0
 
-    def test_until_excludes_today(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
+    def test_until_excludes_today(self, db):
         # until = 12 hours ago — should exclude today's messages
-        cutoff = datetime.now().astimezone() - timedelta(hours=12)
+        cutoff = _NOW - timedelta(hours=12)
         rows = db.by_model(until=cutoff)
-        total_tok = sum(r.tokens.total for r in rows)
         # Only yesterday (300+200) and old (9999) should remain
-        assert total_tok == 300 + 200 + 9999
+        assert sum(r.tokens.total for r in rows) == _TOTAL_YESTERDAY + _TOTAL_OLD
 
-    def test_since_and_until_window(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        now = datetime.now().astimezone()
-        since = now - timedelta(days=2)
-        until = now - timedelta(hours=12)
+    def test_since_and_until_window(self, db):
+        since = _NOW - timedelta(days=2)
+        until = _NOW - timedelta(hours=12)
         rows = db.daily(since=since, until=until)
-        total_tok = sum(r.tokens.total for r in rows)
         # Only yesterday's messages: m4(300) + m5(200)
-        assert total_tok == 500
+        assert sum(r.tokens.total for r in rows) == _TOTAL_YESTERDAY
 
 
 # ── to_dicts ─────────────────────────────────────────────────
 
 
 class TestToDicts:
-    def test_basic_serialization(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        total = db.totals()
-        dicts = db.to_dicts([total])
+    def test_basic_serialization(self, db, totals_row):
+        dicts = db.to_dicts([totals_row])
         assert len(dicts) == 1
         d = dicts[0]
         assert d["label"] == "total"
@@ -393,16 +620,12 @@ class TestToDicts:
             "total",
         }
 
-    def test_detail_becomes_model_key(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        rows = db.by_agent()
-        dicts = db.to_dicts(rows)
+    def test_detail_becomes_model_key(self, db, by_agent_rows):
+        dicts = db.to_dicts(by_agent_rows)
         assert all("model" in d for d in dicts)
 
-    def test_no_detail_no_model_key(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
-        rows = db.by_model()
-        dicts = db.to_dicts(rows)
+    def test_no_detail_no_model_key(self, db, by_model_rows):
+        dicts = db.to_dicts(by_model_rows)
         for d in dicts:
             assert "model" not in d
 
@@ -412,11 +635,29 @@ class TestToDicts:
         dicts = db_cls.to_dicts([row])
         assert dicts[0]["cost"] == 0.1235
 
-    def test_empty_list(self, db_path):
-        db = OpenCodeDB(db_path=db_path)
+    def test_empty_list(self, db):
         assert db.to_dicts([]) == []
 
 
+class TestUsageRow:
+    def test_slotted(self):
+        row = UsageRow(label="x")
+        assert not hasattr(row, "__dict__")
+        assert not hasattr(row.tokens, "__dict__")
+
+    def test_default_tokens_not_shared(self):
+        assert UsageRow(label="a").tokens is not UsageRow(label="b").tokens
+
+
+class TestFetchDicts:
+    @pytest.mark.parametrize("group_by", ["day", "model", "agent", "provider", "session"])
+    def test_matches_to_dicts(self, db, group_by):
+        rows, total = db.fetch(group_by, limit=2)
+        json_rows, json_total = db.fetch_dicts(group_by, limit=2)
+        assert json_rows == db.to_dicts(rows)
+        assert json_total == db.to_dicts([total])[0]
+
+
 # ── _default_db_path ─────────────────────────────────────────
 
 
@@ -468,6 +709,13 @@ class TestDefaultDbPath:
         assert result.parent.name == "opencode"
         assert result.is_absolute()  # Should be absolute path
 
+    def test_resolved_once_per_process(self, monkeypatch):
+        """Test the resolved path is cached after the first call."""
+        monkeypatch.setenv("OPENCODE_DB", "/custom/first.db")
+        first = _default_db_path()
+        monkeypatch.setenv("OPENCODE_DB", "/custom/second.db")
+        assert _default_db_path() is first
+
 
 # ── Insights DB queries fixture ───────────────────────────────────────────────
 
@@ -497,14 +745,14 @@ def _make_part(
         data = {"type": "reasoning", "text": text}
     else:
         data = {"type": part_type}
-    return (part_id, "msg-" + part_id, session_id, time_created, json.dumps(data))
+    return (part_id, "msg-" + part_id, session_id, time_created, _dumps(data))
 
 
 @pytest.fixture()
 def insights_db_path(tmp_path: Path) -> Path:
     """Create a test DB with session, message, and part tables for insights tests."""
     path = tmp_path / "opencode.db"
-    conn = sqlite3.connect(str(path))
+    conn = _connect_scratch(path)
     conn.execute("CREATE TABLE message (id TEXT PRIMARY KEY, session_id TEXT, data TEXT)")
     conn.execute(
         "CREATE TABLE session "
@@ -2,64 +2,88 @@
 
 from __future__ import annotations
 
+import io
+
+import pytest
+from rich.cells import cell_len
+from rich.console import Console
+from rich.table import Table
+from rich.text import Text
+
+from opencode_usage import render
+from opencode_usage.db import TokenStats, UsageRow
 from opencode_usage.render import (
     _fmt_cost,
     _fmt_delta,
+    _fmt_delta_text,
     _fmt_tokens,
+    _make_table,
     _short_model,
     _spark_bar,
+    _spark_bars,
+    console,
+    render_daily,
+    render_grouped,
+    render_report,
+    render_summary,
 )
 
 # ── _fmt_tokens ──────────────────────────────────────────────
 
 
 class TestFmtTokens:
-    def test_zero(self):
-        assert _fmt_tokens(0) == "0"
-
-    def test_below_thousand(self):
-        assert _fmt_tokens(999) == "999"
-
-    def test_exactly_thousand(self):
-        assert _fmt_tokens(1000) == "1.0K"
-
-    def test_fifteen_hundred(self):
-        assert _fmt_tokens(1500) == "1.5K"
-
-    def test_million(self):
-        assert _fmt_tokens(1_000_000) == "1.0M"
-
-    def test_one_point_five_million(self):
-        assert _fmt_tokens(1_500_000) == "1.5M"
-
-    def test_billion(self):
-        assert _fmt_tokens(1_500_000_000) == "1.5B"
-
-    def test_exactly_billion(self):
-        assert _fmt_tokens(1_000_000_000) == "1.0B"
+    @pytest.mark.parametrize(
+        ("n", "expected"),
+        [
+            pytest.param(0, "0", id="zero"),
+            pytest.param(999, "999", id="below_thousand"),
+            pytest.param(1000, "1.0K", id="exactly_thousand"),
+            pytest.param(1500, "1.5K", id="fifteen_hundred"),
+            pytest.param(1_000_000, "1.0M", id="million"),
+            pytest.param(1_500_000, "1.5M", id="one_point_five_million"),
+            pytest.param(1_500_000_000, "1.5B", id="billion"),
+            pytest.param(1_000_000_000, "1.0B", id="exactly_billion"),
+            pytest.param(1_999, "2.0K", id="rounds_up_to_next_whole"),
+            pytest.param(999_999, "1000.0K", id="rounds_up_below_million"),
+            pytest.param(1_150, "1.2K", id="tie_rounds_half_up_k"),
+            pytest.param(2_250_000, "2.3M", id="tie_rounds_half_up_m"),
+        ],
+    )
+    def test_formats(self, n, expected):
+        assert _fmt_tokens(n) == expected
+
+    @pytest.mark.parametrize(
+        ("n", "expected"),
+        [
+            pytest.param(0.0, "0", id="zero"),
+            pytest.param(12.0, "12", id="small_table_lookup"),
+            pytest.param(1500.0, "1.5K", id="thousands"),
+            pytest.param(2_250_000.0, "2.3M", id="millions"),
+        ],
+    )
+    def test_float_sums(self, n, expected):
+        # 1500 and 1500.0 share an lru_cache key; start cold so the float is formatted
+        _fmt_tokens.cache_clear()
+        assert _fmt_tokens(n) == expected
 
 
 # ── _fmt_cost ────────────────────────────────────────────────
 
 
 class TestFmtCost:
-    def test_zero_returns_dash(self):
-        assert _fmt_cost(0) == "-"
-
-    def test_small_value_four_decimals(self):
-        assert _fmt_cost(0.001) == "$0.0010"
-
-    def test_below_penny_four_decimals(self):
-        assert _fmt_cost(0.009) == "$0.0090"
-
-    def test_exactly_penny_two_decimals(self):
-        assert _fmt_cost(0.01) == "$0.01"
-
-    def test_normal_value_two_decimals(self):
-        assert _fmt_cost(1.50) == "$1.50"
-
-    def test_large_cost(self):
-        assert _fmt_cost(123.456) == "$123.46"
+    @pytest.mark.parametrize(
+        ("cost", "expected"),
+        [
+            pytest.param(0, "-", id="zero_returns_dash"),
+            pytest.param(0.001, "$0.0010", id="small_value_four_decimals"),
+            pytest.param(0.009, "$0.0090", id="below_penny_four_decimals"),
+            pytest.param(0.01, "$0.01", id="exactly_penny_two_decimals"),
+            pytest.param(1.50, "$1.50", id="normal_value_two_decimals"),
+            pytest.param(123.456, "$123.46", id="large_cost"),
+        ],
+    )
+    def test_formats(self, cost, expected):
+        assert _fmt_cost(cost) == expected
 
 
 # ── _short_model ─────────────────────────────────────────────
@@ -95,59 +119,145 @@ class TestShortModel:
 
 
 class TestSparkBar:
-    def test_zero_zero_returns_empty(self):
-        assert _spark_bar(0, 0) == "░" * 8
-
-    def test_max_equals_value_returns_full(self):
-        assert _spark_bar(100, 100) == "█" * 8
-
-    def test_negative_value_returns_empty(self):
-        assert _spark_bar(-5, 100) == "░" * 8
-
-    def test_negative_max_returns_empty(self):
-        assert _spark_bar(50, -10) == "░" * 8
-
-    def test_zero_value_positive_max(self):
-        assert _spark_bar(0, 100) == "░" * 8
-
-    def test_mid_value(self):
-        # 50/100 * 8 = 4.0 → round(4.0) = 4 filled
-        assert _spark_bar(50, 100) == "█" * 4 + "░" * 4
-
-    def test_small_fraction_at_least_one(self):
-        # 1/100 * 8 = 0.08 → round = 0, but max(1, 0) = 1 filled
-        assert _spark_bar(1, 100) == "█" + "░" * 7
-
-    def test_value_exceeds_max_clamped(self):
-        # 200/100 clamped to full bar
-        assert _spark_bar(200, 100) == "█" * 8
+    @pytest.mark.parametrize(
+        ("value", "max_value", "filled"),
+        [
+            pytest.param(0, 0, 0, id="zero_zero_returns_empty"),
+            pytest.param(100, 100, 8, id="max_equals_value_returns_full"),
+            pytest.param(-5, 100, 0, id="negative_value_returns_empty"),
+            pytest.param(50, -10, 0, id="negative_max_returns_empty"),
+            pytest.param(0, 100, 0, id="zero_value_positive_max"),
+            # 50/100 * 8 = 4.0 → 4 filled
+            pytest.param(50, 100, 4, id="mid_value"),
+            # 1/100 * 8 = 0.08 → round = 0, but at least 1 filled
+            pytest.param(1, 100, 1, id="small_fraction_at_least_one"),
+            pytest.param(200, 100, 8, id="value_exceeds_max_clamped"),
+            # 5/16 * 8 = 2.5 → 2 and 3/16 * 8 = 1.5 → 2, as round() does
+            pytest.param(5, 16, 2, id="exact_half_rounds_to_even_down"),
+            pytest.param(3, 16, 2, id="exact_half_rounds_to_even_up"),
+        ],
+    )
+    def test_bar(self, value, max_value, filled):
+        assert _spark_bar(value, max_value) == "█" * filled + "░" * (8 - filled)
+
+    def test_bars_built_once_per_width(self):
+        assert _spark_bars(8) is _spark_bars(8)
+        assert _spark_bars(8)[3] == _spark_bar(3, 8)
 
 
 # ── _fmt_delta ───────────────────────────────────────────────
 
 
 class TestFmtDelta:
-    def test_positive_shows_red_up(self):
-        result = _fmt_delta(50.0)
-        assert "red" in result
-        assert "↑" in result
-        assert "50%" in result
-
-    def test_negative_shows_green_down(self):
-        result = _fmt_delta(-30.0)
-        assert "green" in result
-        assert "↓" in result
-        assert "30%" in result
-
-    def test_zero_shows_dim_arrow(self):
-        result = _fmt_delta(0.0)
-        assert "dim" in result
-        assert "→0%" in result
-
-    def test_large_positive(self):
-        result = _fmt_delta(999.0)
-        assert "↑999%" in result
-
-    def test_small_negative(self):
-        result = _fmt_delta(-1.0)
-        assert "↓1%" in result
+    @pytest.mark.parametrize(
+        ("pct", "style", "text"),
+        [
+            pytest.param(50.0, "red", "↑50%", id="positive_shows_red_up"),
+            pytest.param(-30.0, "green", "↓30%", id="negative_shows_green_down"),
+            pytest.param(0.0, "dim", "→0%", id="zero_shows_dim_arrow"),
+            pytest.param(999.0, "red", "↑999%", id="large_positive"),
+            pytest.param(-1.0, "green", "↓1%", id="small_negative"),
+            pytest.param(0.3, "red", "↑0%", id="tiny_rise_keeps_direction"),
+            pytest.param(-0.4, "green", "↓0%", id="tiny_drop_keeps_direction"),
+        ],
+    )
+    def test_formats(self, pct, style, text):
+        result = _fmt_delta(pct)
+        assert style in result
+        assert text in result
+
+    @pytest.mark.parametrize("pct", [50.0, -30.0, 0.0, 999.0, -1.0])
+    def test_text_matches_markup(self, pct):
+        text, markup = _fmt_delta_text(pct), Text.from_markup(_fmt_delta(pct))
+        assert text.plain == markup.plain
+        assert [text.style] == [span.style for span in markup.spans]
+
+
+# ── render_report ────────────────────────────────────────────
+
+
+class TestRenderReport:
+    @staticmethod
+    def _rows() -> list[UsageRow]:
+        return [
+            UsageRow(label="build", calls=3, tokens=TokenStats(total=1500), cost=0.5),
+            UsageRow(label="explore", calls=1, tokens=TokenStats(total=200)),
+        ]
+
+    @pytest.mark.parametrize("group_by", ["day", "model"])
+    def test_matches_separate_prints(self, group_by):
+        rows = self._rows()
+        total = UsageRow(label="total", calls=4, tokens=TokenStats(total=1700), cost=0.5)
+        with console.capture() as separate:
+            render_summary(total, "Last 7 days")
+            console.print()
+            if group_by == "day":
+                render_daily(rows, "Last 7 days")
+            else:
+                render_grouped(rows, group_by, "Last 7 days")
+        with console.capture() as combined:
+            render_report(total, rows, group_by, "Last 7 days")
+        assert combined.get() == separate.get()
+
+
+# ── plain-text tables ────────────────────────────────────────
+
+
+class TestPlainTable:
+    @staticmethod
+    def _agent_rows() -> list[UsageRow]:
+        return [
+            UsageRow(label="build", detail="gemini-3-pro-preview", calls=2, cost=1.5),
+            UsageRow(label="build", detail="deepseek-r1", calls=1),
+            UsageRow(label="explore-with-a-very-long-agent-name", detail="deepseek-r1", calls=1),
+        ]
+
+    def test_used_for_uncolored_pipe(self, monkeypatch):
+        monkeypatch.setattr(render, "console", Console(file=io.StringIO(), no_color=True))
+        out = _make_table("T", "Agent", self._agent_rows(), False, "Model", deltas=[50.0, None, 0])
+        assert isinstance(out, Text)
+        lines = out.plain.splitlines()
+        cells = [[c.strip() for c in line.split("│")] for line in lines]
+        assert cells[1] == ["Agent", "Model", "Calls", "Total", "Cost", "Δ"]
+        assert cells[3] == ["build", "gemini-3-pro", "2", "0", "$1.50", "↑50%"]
+        assert cells[4][:2] == ["", "deepseek-r1"]
+        assert cells[4][-1] == "-"
+        # Agent change → section separator; long label truncated to max_width
+        assert set(lines[5]) == {"─", "┼"}
+        assert cells[6][0] == "explore-with-a-very-lon…"
+
+    def test_wide_labels_keep_columns_aligned(self, monkeypatch):
+        monkeypatch.setattr(render, "console", Console(file=io.StringIO(), no_color=True))
+        rows = [
+            UsageRow(label="日本語のセッション", calls=1),
+            UsageRow(label="Debug Session", calls=2),
+            UsageRow(label="長い" * 20, calls=3),
+        ]
+        out = _make_table("セッション", "Session", rows, False)
+        assert isinstance(out, Text)
+        lines = out.plain.splitlines()
+
+        def bar_cells(line: str) -> list[int]:
+            return [cell_len(line[:i]) for i, ch in enumerate(line) if ch in "│┼"]
+
+        assert len({tuple(bar_cells(line)) for line in lines[1:]}) == 1
+        # Truncated by cells: the label column never exceeds its 30-cell max_width
+        assert cell_len(lines[5].split(" │ ")[0]) <= 30
+        assert lines[5].split(" │ ")[0].rstrip().endswith("…")
+        # Title is centred by display width
+        sep_width = cell_len(lines[2])
+        title_pad = len(lines[0]) - len(lines[0].lstrip())
+        assert abs(2 * title_pad + cell_len("セッション") - sep_width) <= 1
+
+    def test_trend_matches_spark_bar(self, monkeypatch):
+        monkeypatch.setattr(render, "console", Console(file=io.StringIO(), no_color=True))
+        values = [66, 55, 33, 1, 0]
+        rows = [UsageRow(label=f"2025-01-0{i + 1}") for i in range(len(values))]
+        out = _make_table("T", "Date", rows, False, trend_values=values)
+        trend = [line.split(" │ ")[-1] for line in out.plain.splitlines()[3:]]
+        width = len(trend[0])
+        assert trend == [_spark_bar(v, 66, width) for v in values]
+
+    def test_rich_table_when_colored(self, monkeypatch):
+        monkeypatch.setattr(render, "console", Console(file=io.StringIO()))
+        assert isinstance(_make_table("T", "Model", self._agent_rows()), Table)